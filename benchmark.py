@@ -0,0 +1,163 @@
+import argparse
+import asyncio
+import importlib.util
+import multiprocessing
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from bot import SnapsterTradingApp, LogPipeline, ENDPOINT_RATE_LIMITS
+from mock_server import make_query
+
+UNLIMITED = 1e9
+
+class BenchmarkApp(SnapsterTradingApp):
+    """SnapsterTradingApp that records the latency of every endpoint call, including retries."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.latencies = defaultdict(list)
+
+    async def request(self, method: str, url: str, account, payload: dict = None, retries=3):
+        endpoint = url.split('?', 1)[0].rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        try:
+            return await super().request(method, url, account, payload, retries)
+        finally:
+            self.latencies[endpoint].append(time.perf_counter() - started)
+
+def percentile(values: list, fraction: float):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_mock(args):
+    port = free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mock_server.py'),
+            '--port', str(port), '--latency', str(args.latency), '--jitter', str(args.jitter),
+            '--error-rate', str(args.error_rate), '--throttle-rate', str(args.throttle_rate), '--quests', str(args.quests)
+        ],
+        stdout=subprocess.PIPE, text=True
+    )
+    process.stdout.readline()
+    return process, f'http://127.0.0.1:{port}'
+
+def import_time(module: str = 'bot', runs: int = 5):
+    """Median seconds `import module` takes in a fresh interpreter, i.e. what every spawned worker pays before its first request."""
+    code = f"import time; started = time.perf_counter(); import {module}; print(time.perf_counter() - started)"
+    directory = os.path.dirname(os.path.abspath(__file__))
+    return statistics.median(
+        float(subprocess.run([sys.executable, '-c', code], cwd=directory, capture_output=True, text=True, check=True).stdout)
+        for _ in range(runs)
+    )
+
+def run_size(accounts: int, base_url: str, options: dict):
+    """Run one full pass over `accounts` synthetic accounts; executed in a fresh process for a clean peak RSS."""
+    with tempfile.TemporaryDirectory() as directory:
+        query_path = os.path.join(directory, 'query.txt')
+        with open(query_path, 'w') as file:
+            file.writelines(make_query(telegram_id) + '\n' for telegram_id in range(1, accounts + 1))
+
+        app = BenchmarkApp(
+            base_url=base_url, state_path=':memory:', query_path=query_path, rate=UNLIMITED,
+            endpoint_rates=dict.fromkeys(ENDPOINT_RATE_LIMITS, UNLIMITED),
+            logger=LogPipeline(path=None, console=False), journal_path=None, **options
+        )
+
+        async def run():
+            async with app.create_session() as app.session:
+                started = time.perf_counter()
+                await app.run_pass()
+                return time.perf_counter() - started
+
+        cpu_started = time.process_time()
+        elapsed = asyncio.run(run())
+        cpu = time.process_time() - cpu_started
+        app.state.close()
+        app.logger.close()
+
+    return {
+        'accounts': accounts,
+        'http2': app.http2,
+        'http_version': app.http_version,
+        'elapsed': elapsed,
+        'cpu': cpu,
+        'requests': sum(len(values) for values in app.latencies.values()),
+        'latencies': {
+            endpoint: (len(values), percentile(values, 0.5), percentile(values, 0.99))
+            for endpoint, values in sorted(app.latencies.items())
+        },
+        'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource else None
+    }
+
+def report(result: dict):
+    peak_rss = f"{result['peak_rss']:.1f} MB" if result['peak_rss'] is not None else 'n/a'
+    transport = result['http_version']
+    if result['http2'] and transport != 'HTTP/2':
+        transport += ' (HTTP/2 requested, fell back)'
+    print(
+        f"\n{result['accounts']} accounts over {transport}: {result['elapsed']:.2f}s, "
+        f"{result['accounts'] / result['elapsed']:.1f} accounts/s, "
+        f"{result['requests'] / result['elapsed']:.1f} requests/s, "
+        f"{result['cpu'] / result['accounts'] * 1000:.2f} ms CPU/account, peak RSS {peak_rss}"
+    )
+    print(f"  {'endpoint':<24}{'calls':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    for endpoint, (calls, p50, p99) in result['latencies'].items():
+        print(f"  {endpoint:<24}{calls:>8}{p50 * 1000:>10.1f}{p99 * 1000:>10.1f}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="End-to-end throughput benchmark against mock_server.py")
+    parser.add_argument('--accounts', type=int, nargs='+', default=[10, 1000, 10000], help="account counts to run")
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=50, help="mock mean latency in milliseconds")
+    parser.add_argument('--jitter', type=float, default=20, help="mock latency standard deviation in milliseconds")
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--quests', type=int, default=10)
+    parser.add_argument('--startup', action='store_true', help="also report the import time of bot.py in a fresh interpreter")
+    parser.add_argument(
+        '--http2', action='store_true',
+        help="run every size over HTTP/1.1 and again over HTTP/2; needs httpx[http2] and an HTTP/2 TLS --base-url"
+    )
+    parser.add_argument(
+        '--base-url', default=None,
+        help="benchmark an already running server instead of a fresh mock_server.py per run, e.g. an HTTP/2 capable TLS proxy"
+    )
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    context = multiprocessing.get_context('spawn')
+    if args.startup:
+        print(f"import bot: {import_time() * 1000:.1f} ms (median of 5 fresh interpreters)")
+    transports = [False, True] if args.http2 else [False]
+    if args.http2 and importlib.util.find_spec('h2') is None:
+        print("--http2: h2 is not installed (pip install httpx[http2]), the HTTP/2 runs fall back to HTTP/1.1")
+    elif args.http2 and args.base_url is None:
+        print("--http2: mock_server.py only speaks HTTP/1.1, pass --base-url of an HTTP/2 TLS endpoint to compare")
+    for accounts in args.accounts:
+        for http2 in transports:
+            mock, base_url = start_mock(args) if args.base_url is None else (None, args.base_url)
+            try:
+                with context.Pool(1) as pool:
+                    report(pool.apply(run_size, (accounts, base_url, {'concurrency': args.concurrency, 'http2': http2})))
+            finally:
+                if mock is not None:
+                    mock.terminate()
+                    mock.wait()
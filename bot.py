@@ -1,41 +1,1362 @@
-import requests
+import asyncio
+import bisect
+import functools
+import hashlib
+import heapq
+import importlib.util
+import itertools
+import queue
 import json
 import os
 import urllib.parse
 import random
+import sqlite3
+import sys
+import threading
+from collections import Counter, defaultdict
 from colorama import *
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+import math
 import time
-import pytz
+from types import MappingProxyType
 
-wib = pytz.timezone('Asia/Jakarta')
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def lazy_import(name: str):
+    """Return `name` as a module whose body only runs on first attribute access.
+
+    httpx alone is most of the import time of this file, and the --workers parent, --plan and
+    the log/metrics helpers never send a request, so they never pay for it.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"No module named '{name}'")
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = sys.modules[name] = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+httpx = lazy_import('httpx')
+h2_available = importlib.util.find_spec('h2') is not None
+
+wib = timezone(timedelta(hours=7), 'WIB')
+json_loads = orjson.loads if orjson is not None else json.loads
+
+BASE_URL = 'https://prod.snapster.bot'
+BASE_HEADERS = MappingProxyType({
+    'Accept': 'application/json, text/plain, */*',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Cache-Control': 'no-cache',
+    'Host': 'prod.snapster.bot',
+    'Origin': 'https://prod.snapster.bot',
+    'Pragma': 'no-cache',
+    'Referer': 'https://prod.snapster.bot/main',
+    'Sec-Fetch-Dest': 'empty',
+    'Sec-Fetch-Mode': 'cors',
+    'Sec-Fetch-Site': 'same-origin',
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36 Edg/128.0.0.0'
+})
+
+STEP_RETRY_DELAY = 300
+WAKE_SLACK = 60
+REQUEST_TIMEOUT = 30
+REQUEST_DEADLINE = 60
+BACKOFF_BASE = 1
+BACKOFF_MAX = 30
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+RATE_LIMIT = 10
+ENDPOINT_RATE_LIMITS = {
+    'getUserByTelegramId': 5,
+    'startQuest': 5,
+    'claimQuestBonus': 5
+}
+AIMD_INCREASE = 0.1
+AIMD_DECREASE = 0.5
+AIMD_CEILING = 4
+BREAKER_FAILURES = 5
+BREAKER_COOLDOWN = 60
+BREAKER_PROBE_INTERVAL = 5
+ACCOUNT_RELOAD_INTERVAL = 10
+INIT_DATA_TTL = 0
+STALE_REPORT_LIMIT = 20
+QUEST_CONCURRENCY = 5
+PLAN_REQUEST_LATENCY = 0.25
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LOG_LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40}
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUPS = 3
+LOG_BATCH = 1024
+DASHBOARD_HZ = 2
+JOURNAL_COMPACT_LINES = 10000
+JOURNAL_ITEM_TTL = 24 * 3600
+CASSETTE_HEADERS = ('content-type', 'retry-after')
+CASSETTE_PII = ('username', 'firstName', 'lastName', 'first_name', 'last_name', 'photoUrl')
+PROFILE_TOP = 5
+STATE_TTL = {
+    'user': 1800,
+    'leagues': 6 * 3600,
+    'quests': 6 * 3600
+}
+
+class Message(str, Enum):
+    """API `message` values the bot branches on; anything else parses to UNKNOWN."""
+    USER_FETCHED = 'Successfully fetched User'
+    DAILY_CLAIMED = 'Successfully claimed Daily Bonus points'
+    LEAGUES_FETCHED = 'Successfully fetched Leagues'
+    # League claims are answered with the referral message as well.
+    REFERRAL_CLAIMED = 'Successfully claimed Referral points'
+    NOT_ELIGIBLE = 'Not eligible for claiming bonus'
+    MINING_CLAIMED = 'Successfully claimed Mining Bonus points'
+    QUESTS_FETCHED = 'Successfully fetched Quests for User'
+    QUEST_STARTED = 'Successfully started Quest earn'
+    QUEST_CLAIMED = 'Successfully claimed Quest points'
+    QUEST_ALREADY_CLAIMED = 'Not possible to claim bonus for this quest'
+    UNKNOWN = ''
+
+    @classmethod
+    def parse(cls, text):
+        try:
+            return cls(text)
+        except ValueError:
+            return cls.UNKNOWN
+
+def unwrap(body, message: Message):
+    """Return the `data` of a decoded reply if its message is the expected one, else None."""
+    if isinstance(body, dict) and Message.parse(body.get('message')) is message:
+        return body.get('data')
+    return None
+
+@functools.lru_cache(maxsize=4096)
+def parse_timestamp(value: str):
+    """Epoch seconds of an API timestamp like '2024-09-01T12:34:56.789Z'; cached as accounts repeat the same few values."""
+    try:
+        return datetime.fromisoformat(value[:-1] + '+00:00' if value.endswith('Z') else value).timestamp()
+    except ValueError:
+        return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%fZ").replace(tzinfo=timezone.utc).timestamp()
+
+class User:
+    """The fields of getUserByTelegramId the bot reads; the rest of the payload is dropped."""
+    __slots__ = ('username', 'points', 'league', 'last_daily_claim')
+
+    def __init__(self, username: str, points: int, league: str, last_daily_claim: str = None) -> None:
+        self.username = username
+        self.points = points
+        self.league = league
+        self.last_daily_claim = last_daily_claim
+
+    @classmethod
+    def from_data(cls, data: dict):
+        return cls(data['username'], data['pointsCount'], data['currentLeague']['title'], data.get('lastDailyBonusClaimDate'))
+
+    def to_data(self):
+        return {
+            'username': self.username,
+            'pointsCount': self.points,
+            'currentLeague': {'title': self.league},
+            'lastDailyBonusClaimDate': self.last_daily_claim
+        }
+
+class League:
+    __slots__ = ('id', 'title', 'required_points', 'status')
+
+    def __init__(self, league_id: int, title: str, required_points: int, status: str = None) -> None:
+        self.id = league_id
+        self.title = title
+        self.required_points = required_points
+        self.status = status
+
+    @classmethod
+    def from_data(cls, data: dict):
+        status = data.get('status')
+        return cls(data['leagueId'], data['title'], data['requiredNumberOfPointsToAchieve'], status and sys.intern(status))
+
+    def to_data(self):
+        return {'leagueId': self.id, 'title': self.title, 'requiredNumberOfPointsToAchieve': self.required_points}
+
+    def __eq__(self, other):
+        return isinstance(other, League) and self.to_data() == other.to_data()
+
+class Quest:
+    __slots__ = ('id', 'title', 'status')
+
+    def __init__(self, quest_id: int, title: str, status: str = None) -> None:
+        self.id = quest_id
+        self.title = title
+        self.status = status
+
+    @classmethod
+    def from_data(cls, data: dict):
+        status = data.get('status')
+        return cls(data['id'], data['title'], status and sys.intern(status))
+
+    def to_data(self):
+        return {'id': self.id, 'title': self.title}
+
+    def __eq__(self, other):
+        return isinstance(other, Quest) and self.to_data() == other.to_data()
+
+class ClaimResult:
+    """Outcome of a start/claim call: the parsed message and the points it credited."""
+    __slots__ = ('message', 'points')
+
+    def __init__(self, message: Message, points: int = 0) -> None:
+        self.message = message
+        self.points = points
+
+    @classmethod
+    def from_body(cls, body):
+        if not isinstance(body, dict):
+            return None
+        data = body.get('data')
+        return cls(Message.parse(body.get('message')), data.get('pointsClaimed', 0) if isinstance(data, dict) else 0)
+
+class Step:
+    """One entry of the claim pipeline.
+
+    `run` and `due` name app methods: `run(account, **needs)` performs the step and returns False to retry it after
+    STEP_RETRY_DELAY, `due(**needs)` returns when the step is next due or None if it is due now. `needs` are inputs
+    loaded once per account (`fetch_<name>`), `after` are steps of the same pass that must finish first.
+    """
+    __slots__ = ('name', 'interval', 'endpoints', 'run', 'needs', 'after', 'due')
+
+    def __init__(self, name: str, interval: float, endpoints: tuple, run: str,
+                 needs: tuple = (), after: tuple = (), due: str = None) -> None:
+        self.name = name
+        self.interval = interval
+        self.endpoints = endpoints
+        self.run = run
+        self.needs = needs
+        self.after = after
+        self.due = due
+
+STEP_REGISTRY = {step.name: step for step in (
+    Step('daily', 24 * 3600, ('claimDailyQuestBonus',), 'run_daily', needs=('user',), due='daily_due'),
+    Step('leagues', 1800, ('getLeagues', 'claimLeagueBonus'), 'run_leagues', needs=('user',), after=('daily',)),
+    Step('referral', 1800, ('claimReferralPoints',), 'run_referral'),
+    Step('mining', 1800, ('claimMiningBonus',), 'run_mining'),
+    Step('quests', 1800, ('getQuests', 'startQuest', 'claimQuestBonus'), 'run_quests')
+)}
+STEPS = tuple(STEP_REGISTRY)
+# Endpoint each `needs` input is fetched from, so a step is also blocked by the breaker of what it needs.
+NEED_ENDPOINTS = {'user': 'getUserByTelegramId'}
+
+class TokenBucket:
+    """Token bucket whose refill rate backs off multiplicatively on overload and grows additively otherwise.
+
+    The configured rate is only the starting point: while the server keeps answering, the rate
+    probes upwards to AIMD_CEILING times that, so it settles near what the server actually allows.
+    """
+
+    def __init__(self, rate: float) -> None:
+        self.max_rate = rate * AIMD_CEILING
+        self.min_rate = rate / 20
+        self.rate = rate
+        self.capacity = max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.decreased_at = float('-inf')
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def on_success(self):
+        self.rate = min(self.max_rate, self.rate + AIMD_INCREASE)
+
+    def on_overload(self):
+        """Back off at most once per refill window (the time to refill a full bucket).
+
+        The 429s/5xx of requests already in flight belong to the same congestion event, so only the first one counts.
+        """
+        now = time.monotonic()
+        if now - self.decreased_at < self.capacity / self.rate:
+            return
+        self.decreased_at = now
+        self.rate = max(self.min_rate, self.rate * AIMD_DECREASE)
+
+class RateLimiter:
+    """One global bucket plus per-endpoint budgets, shared by every account."""
+
+    def __init__(self, rate: float = RATE_LIMIT, endpoint_rates: dict = None) -> None:
+        self.bucket = TokenBucket(rate)
+        self.endpoints = {
+            endpoint: TokenBucket(endpoint_rate)
+            for endpoint, endpoint_rate in {**ENDPOINT_RATE_LIMITS, **(endpoint_rates or {})}.items()
+        }
+
+    async def acquire(self, endpoint: str):
+        if endpoint in self.endpoints:
+            await self.endpoints[endpoint].acquire()
+        await self.bucket.acquire()
+
+    def feedback(self, endpoint: str, status_code: int):
+        overloaded = status_code == 429 or status_code >= 500
+        for bucket in (self.bucket, self.endpoints.get(endpoint)):
+            if bucket is None:
+                continue
+            if overloaded:
+                bucket.on_overload()
+            else:
+                bucket.on_success()
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker for one endpoint.
+
+    BREAKER_FAILURES consecutive overload or transport failures open it; after
+    BREAKER_COOLDOWN it goes half-open and lets one probe through every
+    BREAKER_PROBE_INTERVAL seconds until a probe succeeds (closed) or fails (open again).
+    Results are reported with the ticket allow() handed out, so a call admitted before
+    the breaker tripped cannot close it when it comes back late: only the probe can.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_at = 0.0
+        self.probe = None
+
+    def retry_at(self):
+        """When calls may go through again, or None if they may right now."""
+        now = time.time()
+        if self.state == self.OPEN and now < self.opened_at + BREAKER_COOLDOWN:
+            return self.opened_at + BREAKER_COOLDOWN
+        if self.state == self.HALF_OPEN and now < self.probe_at:
+            return self.probe_at
+        return None
+
+    def allow(self):
+        """Return a ticket for one attempt, or None while calls are refused."""
+        if self.state == self.CLOSED:
+            return True
+        if self.retry_at() is not None:
+            return None
+
+        self.state = self.HALF_OPEN
+        self.probe_at = time.time() + BREAKER_PROBE_INTERVAL
+        self.probe = object()
+        return self.probe
+
+    def success(self, ticket=True):
+        """Record a healthy response; returns True when this closes the breaker."""
+        if self.state == self.CLOSED:
+            self.failures = 0
+            return False
+        if self.state == self.OPEN or ticket is not self.probe:
+            return False
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.probe = None
+        return True
+
+    def failure(self, ticket=True):
+        """Record a failed attempt; returns True when this opens the breaker."""
+        if self.state == self.OPEN or (self.state == self.HALF_OPEN and ticket is not self.probe):
+            return False
+
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= BREAKER_FAILURES:
+            self.state = self.OPEN
+            self.opened_at = time.time()
+            self.probe = None
+            return True
+        return False
+
+class Histogram:
+    """Fixed-bucket latency histogram; counts are per bucket, the last slot is +Inf."""
+    __slots__ = ('counts', 'sum', 'count')
 
-class SnapsterTradingApp:
     def __init__(self) -> None:
-        self.session = requests.Session()
-        self.headers = {
-            'Accept': 'application/json, text/plain, */*',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Cache-Control': 'no-cache',
-            'Host': 'prod.snapster.bot',
-            'Origin': 'https://prod.snapster.bot',
-            'Pragma': 'no-cache',
-            'Referer': 'https://prod.snapster.bot/main',
-            'Sec-Fetch-Dest': 'empty',
-            'Sec-Fetch-Mode': 'cors',
-            'Sec-Fetch-Site': 'same-origin',
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36 Edg/128.0.0.0'
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float):
+        """Upper bound of the bucket holding the q-th observation (inf when past the last bucket)."""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return math.inf
+
+class Metrics:
+    """Request latency, outcome and retry counters plus per-cycle gauges, rendered as OpenMetrics text."""
+
+    def __init__(self) -> None:
+        self.latency = {}
+        self.requests = 0
+        self.outcomes = Counter()
+        self.retries = Counter()
+        self.cycle = self.new_cycle()
+        self.last_cycle = None
+
+    def new_cycle(self):
+        return {'started': time.time(), 'processed': 0, 'failed': 0, 'points': 0, 'latency': {}, 'retries': Counter()}
+
+    def observe(self, endpoint: str, seconds: float, outcome: str):
+        for latency in (self.latency, self.cycle['latency']):
+            histogram = latency.get(endpoint)
+            if histogram is None:
+                histogram = latency[endpoint] = Histogram()
+            histogram.observe(seconds)
+        self.outcomes[endpoint, outcome] += 1
+        self.requests += 1
+
+    def skipped(self, endpoint: str):
+        self.outcomes[endpoint, 'circuit open'] += 1
+
+    def coalesced(self, endpoint: str):
+        self.outcomes[endpoint, 'coalesced'] += 1
+
+    def retry(self, endpoint: str):
+        self.retries[endpoint] += 1
+        self.cycle['retries'][endpoint] += 1
+
+    def account(self, ok: bool):
+        self.cycle['processed' if ok else 'failed'] += 1
+
+    def claimed(self, points: int):
+        self.cycle['points'] += points
+
+    def end_cycle(self):
+        """Close the current cycle and return its figures."""
+        self.last_cycle = self.cycle
+        self.cycle = self.new_cycle()
+        return self.last_cycle
+
+    def render(self):
+        def labels(**values):
+            escaped = {
+                name: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                for name, value in values.items()
+            }
+            return '{' + ','.join(f'{name}="{value}"' for name, value in escaped.items()) + '}'
+
+        lines = ['# TYPE snapster_request_duration_seconds histogram', '# UNIT snapster_request_duration_seconds seconds']
+        for endpoint, histogram in sorted(self.latency.items()):
+            cumulative = 0
+            for bound, count in zip(tuple(map(float, LATENCY_BUCKETS)) + ('+Inf',), histogram.counts):
+                cumulative += count
+                lines.append(f'snapster_request_duration_seconds_bucket{labels(endpoint=endpoint, le=bound)} {cumulative}')
+            lines.append(f'snapster_request_duration_seconds_sum{labels(endpoint=endpoint)} {histogram.sum}')
+            lines.append(f'snapster_request_duration_seconds_count{labels(endpoint=endpoint)} {histogram.count}')
+
+        lines.append('# TYPE snapster_requests counter')
+        for (endpoint, outcome), count in sorted(self.outcomes.items()):
+            lines.append(f'snapster_requests_total{labels(endpoint=endpoint, outcome=outcome)} {count}')
+
+        lines.append('# TYPE snapster_retries counter')
+        for endpoint, count in sorted(self.retries.items()):
+            lines.append(f'snapster_retries_total{labels(endpoint=endpoint)} {count}')
+
+        for name, key in (('accounts_processed', 'processed'), ('accounts_failed', 'failed'), ('points_claimed', 'points')):
+            lines.append(f'# TYPE snapster_cycle_{name} gauge')
+            for cycle, figures in (('current', self.cycle), ('last', self.last_cycle)):
+                if figures is not None:
+                    lines.append(f'snapster_cycle_{name}{labels(cycle=cycle)} {figures[key]}')
+
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+COLORS = MappingProxyType({
+    'C': Fore.CYAN + Style.BRIGHT,
+    'B': Fore.BLUE + Style.BRIGHT,
+    'G': Fore.GREEN + Style.BRIGHT,
+    'M': Fore.MAGENTA + Style.BRIGHT,
+    'R': Fore.RED + Style.BRIGHT,
+    'W': Fore.WHITE + Style.BRIGHT,
+    'Y': Fore.YELLOW + Style.BRIGHT,
+    'X': Style.RESET_ALL
+})
+CONSOLE_FORMATS = {
+    'banner': "{G}Account's Total: {X}{W}{total}{X}{G} | Concurrency: {X}{W}{concurrency}{X}{G} | Workers: {X}{W}{workers}{X}",
+    'separator': "{C}-{X}" * 75,
+    'accounts.stale': "{M}[ Init Data Expired{X}{Y} {count} Accounts {X}{M}] [ Telegram ID{X}{W} {telegram_ids} {X}{M}]{X}",
+    'accounts.invalid': "{Y}Invalid Query Lines: {X}{W}{invalid}{X}{Y} lines without a telegram user id skipped, fix them in query.txt{X}",
+    'accounts.duplicates': "{Y}Duplicate Accounts: {X}{W}{duplicates}{X}{Y} older query lines ignored, newest init data kept per account{X}",
+    'accounts.reloaded': "{G}Accounts Reloaded: {X}{W}+{added} -{removed}{X}{G} | Total: {X}{W}{total}{X}",
+    'account.login_failed': "{M}[ Account ID{X}{W} {telegram_id} {X}{M}] [ Status{X}{R} Login Failed {X}{M}]{X}",
+    'account.user_missing': "{M}[ Account ID{X}{W} {telegram_id} {X}{M}] [ Status{X}{R} User Data Is None {X}{M}]{X}",
+    'account.user': "{M}[ Username{X}{W} {username} {X}{M}]{X}{M}[ Points{X}{W} {points} $SNAPS {X}{M}]{X}{M}[ League{X}{W} {league} {X}{M}]{X}",
+    'account.id': "{M}[ Account ID{X}{W} {telegram_id} {X}{M}]{X}",
+    'account.resumed': "{M}[ Account ID{X}{W} {telegram_id} {X}{M}] [ Resumed, Skipping{X}{W} {steps} {X}{M}]{X}",
+    'account.error': "{R}An error occurred: {error}{X}",
+    'daily.claimed': "{M}[ Check-In{X}{G} Is Claimed {X}{M}] [ Rewards{X}{W} {points} $SNAPS {X}{M}]{X}",
+    'daily.failed': "{M}[ Check-In{X}{R} Isn't Claimed {X}{M}]{X}",
+    'league.claimed': "{M}[ League Bonus{X}{W} {league} {X}{G}Is Claimed{X}{M} ] [ Rewards{X}{W} {points} $SNAPS {X}{M}]{X}",
+    'league.not_eligible': "{M}[ League Bonus{X}{W} {league} {X}{Y}Not Eligible{X}{M} ] [ Reason{X}{W} -{missing} $SNAPS {X}{M}]{X}",
+    'league.max_level': "{M}[ League{X}{Y} Already Reached Max Level {X}{M}]{X}",
+    'league.failed': "{M}[ League Bonus{X}{W} {league} {X}{R}Isn't Claimed{X}{M} ]{X}",
+    'leagues.missing': "{M}[ League{X}{R} Data Is None {X}{M}]{X}",
+    'referral.claimed': "{M}[ Refferal{X}{G} Is Claimed {X}{M}] [ Rewards{X}{W} {points} $SNAPS {X}{M}]{X}",
+    'referral.empty': "{M}[ Refferal{X}{Y} Not Available Points {X}{M}]{X}",
+    'referral.failed': "{M}[ Refferal{X}{R} Isn't Claimed {X}{M}]{X}",
+    'mining.claimed': "{M}[ Mining{X}{G} Is Claimed {X}{M}] [ Rewards{X}{W} {points} $SNAPS {X}{M}]{X}",
+    'mining.empty': "{M}[ Mining{X}{Y} Not Available Points {X}{M}]{X}",
+    'mining.failed': "{M}[ Mining{X}{R} Isn't Claimed {X}{M}]{X}",
+    'quests.missing': "{M}[ Quests{X}{R} Data Is None {X}{M}]{X}",
+    'quest.not_started': "{M}[ Quest{X}{W} {quest} {X}{R}Isn't Started{X}{M} ]{X}",
+    'quest.started': "{M}[ Quest{X}{W} {quest} {X}{G}Is Started{X}{M} ]{X}",
+    'quest.claimed': "{M}[ Quest{X}{W} {quest} {X}{G}Is Claimed{X}{M} ] [ Rewards{X}{W} {points} $SNAPS {X}{M}]{X}",
+    'quest.already_claimed': "{M}[ Quest{X}{W} {quest} {X}{Y}Is Already Claimed{X}{M} ]{X}",
+    'quest.failed': "{M}[ Quest{X}{W} {quest} {X}{R}Isn't Claimed{X}{M} ]{X}",
+    'breaker.opened': "{R}[ Circuit Open{X}{W} {endpoint} {X}{R}]{X}{Y} Skipping calls until{X}{W} {retry_at} {X}",
+    'breaker.closed': "{G}[ Circuit Closed{X}{W} {endpoint} {X}{G}] Endpoint recovered{X}",
+    'step.not_due': "{M}[ {step}{X}{Y} Already Claimed {X}{M}] [ Next Claim at{X}{W} {due_at} {X}{M}]{X}",
+    'step.error': "{M}[ {step}{X}{R} Failed: {error} {X}{M}]{X}",
+    'step.skipped': "{M}[ {step}{X}{Y} Skipped, {endpoint} Unavailable {X}{M}] [ Retry at{X}{W} {retry_at} {X}{M}]{X}",
+    'http.version': "{G}[ Connected{X}{W} {version} {X}{G}]{X}",
+    'http2.unavailable': "{Y}HTTP/2 needs the h2 package (pip install httpx[http2]), falling back to HTTP/1.1{X}",
+    'http.retry': "{R}HTTP ERROR{X}{W} {endpoint} {X}{Y}Retrying... {X}{W}[{attempt}/{retries}]{X}",
+    'plan.summary': "{M}[ Plan{X}{W} {accounts} Accounts {X}{M}] [ Due{X}{W} {due} {X}{M}] [ Stale{X}{W} {stale} {X}{M}] [ Uncached{X}{W} {uncached} {X}{M}] [ Requests{X}{W} {requests} {X}{M}] [ Est. Time{X}{W} {estimate_seconds} {X}{M}] [ Planned in{X}{W} {elapsed_ms} ms {X}{M}]{X}",
+    'plan.step': "{M}[ {step}{X}{M} ] [ Due Accounts{X}{W} {accounts} {X}{M}]{X}",
+    'plan.endpoint': "{M}[ {endpoint}{X}{M} ] [ Calls{X}{W} {calls} {X}{M}]{X}",
+    'profile.cycle': "{M}[ Profile{X}{W} {path} {X}{M}] [ CPU{X}{W} {cpu_ms} ms {X}{M}] [ Peak Memory{X}{W} {peak_kb} KB {X}{M}]{X}",
+    'profile.allocation': "{M}[ Allocations{X}{W} {location} {X}{M}] [ Growth{X}{W} +{size_kb} KB / +{blocks} blocks {X}{M}]{X}",
+    'cycle.summary': "{M}[ Cycle Summary{X}{W} {elapsed_seconds} {X}{M}] [ Accounts{X}{W} {processed} {X}{M}] [ Failed{X}{W} {failed} {X}{M}] [ Points{X}{W} {points} $SNAPS {X}{M}]{X}",
+    'cycle.endpoint': "{M}[ {endpoint}{X}{M} ] [ Calls{X}{W} {calls} {X}{M}] [ Avg{X}{W} {avg_ms} ms {X}{M}] [ p99{X}{W} {p99} {X}{M}] [ Retries{X}{W} {retries} {X}{M}]{X}",
+    'workers.idle': "{M}[ Workers Idle{X}{W} {idle}/{workers} {X}{M}] [ Processed{X}{W} {processed} {X}{M}] [ Failed{X}{W} {failed} {X}{M}] [ Next Wakeup{X}{W} {next_wakeup_at} {X}{M}]{X}",
+    'exit': "{R}[ EXIT ] Snapster Trading App - BOT.{X}",
+    'error': "{R}An error occurred: {error}{X}"
+}
+CONSOLE_ONLY = {'banner', 'separator'}
+
+def format_seconds(seconds):
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{int(hours):02}:{int(minutes):02}:{int(seconds):02}"
+
+class LogEvent:
+    """One structured log record; nothing is formatted until a sink asks for it."""
+    __slots__ = ('created', 'level', 'event', 'fields', 'worker')
+
+    def __init__(self, created: float, level: str, event: str, fields: dict, worker: int = None) -> None:
+        self.created = created
+        self.level = level
+        self.event = event
+        self.fields = fields
+        self.worker = worker
+
+class LogPipeline:
+    """Queue-fed background writer for LogEvents.
+
+    Every event goes to a size-rotated file as one JSON line; the optional colored
+    console sink applies a level filter and samples per-account INFO events. Both
+    sinks are flushed once per drained batch, so callers never touch the terminal.
+    """
+
+    def __init__(self, path: str = 'bot.log', console: bool = True, console_level: str = 'INFO',
+                 sample: float = 1.0, max_bytes: int = LOG_MAX_BYTES, backups: int = LOG_BACKUPS) -> None:
+        self.path = path
+        self.console = console
+        self.console_level = LOG_LEVELS[console_level]
+        self.sample = sample
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.file = open(path, 'a', encoding='utf-8') if path else None
+        self.size = self.file.tell() if self.file else 0
+        self.threshold = min(
+            LOG_LEVELS['DEBUG'] if self.file else math.inf,
+            self.console_level if console else math.inf
+        )
+        self.stamped_second = None
+        self.stamp = ''
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.drain, name='log-writer', daemon=True)
+        self.thread.start()
+
+    def enabled(self, level: str):
+        return LOG_LEVELS[level] >= self.threshold
+
+    def submit(self, event: LogEvent):
+        self.queue.put(event)
+
+    def drain(self):
+        while True:
+            batch = [self.queue.get()]
+            try:
+                while len(batch) < LOG_BATCH:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            lines = []
+            for event in batch:
+                if event is None:
+                    continue
+                if self.file and event.event not in CONSOLE_ONLY:
+                    self.write(event)
+                if self.shows(event):
+                    lines.append(self.render(event))
+
+            if lines:
+                sys.stdout.write('\n'.join(lines) + '\n')
+                sys.stdout.flush()
+            if self.file:
+                self.file.flush()
+            if None in batch:
+                return
+
+    def write(self, event: LogEvent):
+        record = {'time': round(event.created, 3), 'level': event.level, 'event': event.event}
+        if event.worker is not None:
+            record['worker'] = event.worker
+        record.update(event.fields)
+        line = json.dumps(record, default=str) + '\n'
+        if self.size and self.size + len(line) > self.max_bytes:
+            self.rotate()
+        self.file.write(line)
+        self.size += len(line)
+
+    def rotate(self):
+        self.file.close()
+        for index in range(self.backups - 1, 0, -1):
+            if os.path.exists(f'{self.path}.{index}'):
+                os.replace(f'{self.path}.{index}', f'{self.path}.{index + 1}')
+        if self.backups:
+            os.replace(self.path, f'{self.path}.1')
+        self.file = open(self.path, 'w', encoding='utf-8')
+        self.size = 0
+
+    def shows(self, event: LogEvent):
+        if not self.console or LOG_LEVELS[event.level] < self.console_level:
+            return False
+        if self.sample < 1 and event.level == 'INFO' and 'telegram_id' in event.fields:
+            return random.random() < self.sample
+        return True
+
+    def timestamp(self, created: float):
+        second = int(created)
+        if second != self.stamped_second:
+            self.stamped_second = second
+            self.stamp = datetime.fromtimestamp(second, wib).strftime('%x %X %Z')
+        return self.stamp
+
+    def render(self, event: LogEvent):
+        fields = {}
+        for name, value in event.fields.items():
+            if name.endswith('_at') and value is not None:
+                value = datetime.fromtimestamp(value, wib).strftime('%x %X %Z')
+            elif name.endswith('_seconds'):
+                value = format_seconds(value)
+            fields[name] = value
+
+        template = CONSOLE_FORMATS.get(event.event)
+        try:
+            message = template.format(**COLORS, **fields)
+        except (AttributeError, KeyError, IndexError, ValueError):
+            message = f"{event.event} {fields}"
+        if 'telegram_id' in fields and (template is None or '{telegram_id}' not in template):
+            # Accounts run concurrently, so every per-account line has to say whose it is.
+            message = f"{Fore.MAGENTA + Style.BRIGHT}[ Account{Style.RESET_ALL}{Fore.WHITE + Style.BRIGHT} {fields['telegram_id']} {Style.RESET_ALL}{Fore.MAGENTA + Style.BRIGHT}]{Style.RESET_ALL} {message}"
+        if event.worker is not None:
+            message = f"{Fore.BLUE + Style.BRIGHT}[ Worker {event.worker} ]{Style.RESET_ALL} {message}"
+        return (
+            f"{Fore.CYAN + Style.BRIGHT}[ {self.timestamp(event.created)} ]{Style.RESET_ALL}"
+            f"{Fore.WHITE + Style.BRIGHT} | {Style.RESET_ALL}{message}"
+        )
+
+    def close(self):
+        if not self.thread.is_alive():
+            return
+        self.queue.put(None)
+        self.thread.join()
+        if self.file:
+            self.file.close()
+
+class Dashboard:
+    """Aggregate status view redrawn in place with ANSI escapes, instead of scrolling per-account lines."""
+
+    def __init__(self, workers: int = 1) -> None:
+        self.workers = workers
+        self.requests = None
+        self.updated = time.monotonic()
+        self.rate = 0.0
+        self.drawn = False
+
+    def draw(self, stats: dict):
+        now = time.monotonic()
+        if self.requests is not None and now > self.updated:
+            current = (stats['requests'] - self.requests) / (now - self.updated)
+            self.rate = current if not self.rate else (self.rate + current) / 2
+        self.requests = stats['requests']
+        self.updated = now
+
+        next_wakeup = stats['next_wakeup']
+        if next_wakeup is None:
+            wakeup = '-'
+        elif next_wakeup <= time.time():
+            wakeup = 'now'
+        else:
+            wakeup = (
+                f"{datetime.fromtimestamp(next_wakeup, wib).strftime('%x %X %Z')}"
+                f" (in {format_seconds(next_wakeup - time.time())})"
+            )
+
+        def row(label, value, other_label, other_value):
+            return (
+                f"{Fore.MAGENTA + Style.BRIGHT}{label:<12}: {Style.RESET_ALL}{Fore.WHITE + Style.BRIGHT}{str(value):<16}{Style.RESET_ALL}"
+                f"{Fore.MAGENTA + Style.BRIGHT}{other_label:<8}: {Style.RESET_ALL}{Fore.WHITE + Style.BRIGHT}{other_value}{Style.RESET_ALL}"
+            )
+
+        lines = [
+            f"{Fore.GREEN + Style.BRIGHT}Auto Claim {Fore.BLUE + Style.BRIGHT}Snapster Trading App - BOT{Style.RESET_ALL}",
+            f"{Fore.CYAN + Style.BRIGHT}[ {datetime.now(wib).strftime('%x %X %Z')} ]{Style.RESET_ALL}",
+            f"{Fore.CYAN + Style.BRIGHT}-{Style.RESET_ALL}" * 60,
+            row('Accounts', stats['accounts'], 'Workers', self.workers),
+            row('In Flight', stats['in_flight'], 'Queued', stats['queued']),
+            row('Done', stats['done'], 'Failed', stats['failed']),
+            row('Requests/s', f"{self.rate:.1f}", 'Points', f"{stats['points']} $SNAPS"),
+            f"{Fore.MAGENTA + Style.BRIGHT}{'Next Wakeup':<12}: {Style.RESET_ALL}{Fore.WHITE + Style.BRIGHT}{wakeup}{Style.RESET_ALL}"
+        ]
+        frame = ''.join(f"{line}\033[K\n" for line in lines)
+        sys.stdout.write(('\033[2J\033[?25l' if not self.drawn else '') + '\033[H' + frame + '\033[J')
+        sys.stdout.flush()
+        self.drawn = True
+
+    def close(self):
+        if self.drawn:
+            sys.stdout.write('\033[?25h')
+            sys.stdout.flush()
+
+    @staticmethod
+    def combine(snapshots):
+        """Sum per-worker snapshots into one, keeping the earliest wakeup."""
+        snapshots = list(snapshots)
+        total = {key: sum(snapshot[key] for snapshot in snapshots) for key in snapshots[0] if key != 'next_wakeup'}
+        wakeups = [snapshot['next_wakeup'] for snapshot in snapshots if snapshot['next_wakeup'] is not None]
+        total['next_wakeup'] = min(wakeups) if wakeups else None
+        return total
+
+class StateStore:
+    """SQLite-backed per-account cache of API payloads and step schedules that survives restarts."""
+
+    def __init__(self, path: str = 'state.db') -> None:
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS state ('
+            'telegram_id TEXT NOT NULL, kind TEXT NOT NULL, payload TEXT NOT NULL, updated_at REAL NOT NULL, '
+            'PRIMARY KEY (telegram_id, kind))'
+        )
+        self.conn.commit()
+
+    def get(self, telegram_id: str, kind: str, ttl: float = None):
+        row = self.conn.execute(
+            'SELECT payload, updated_at FROM state WHERE telegram_id = ? AND kind = ?', (telegram_id, kind)
+        ).fetchone()
+        if row is None or (ttl is not None and time.time() - row[1] > ttl):
+            return None
+        return json.loads(row[0])
+
+    def load(self, kind: str):
+        """Return {telegram_id: (raw payload, updated_at)} for every account in one query; payloads are left undecoded."""
+        return {
+            telegram_id: (payload, updated_at) for telegram_id, payload, updated_at in
+            self.conn.execute('SELECT telegram_id, payload, updated_at FROM state WHERE kind = ?', (kind,))
         }
 
-    def clear_terminal(self):
-        os.system('cls' if os.name == 'nt' else 'clear')
+    def put(self, telegram_id: str, kind: str, payload):
+        self.conn.execute(
+            'INSERT OR REPLACE INTO state (telegram_id, kind, payload, updated_at) VALUES (?, ?, ?, ?)',
+            (telegram_id, kind, json.dumps(payload), time.time())
+        )
+        self.conn.commit()
 
-    def log(self, message):
-        print(
-            f"{Fore.CYAN + Style.BRIGHT}[ {datetime.now().astimezone(wib).strftime('%x %X %Z')} ]{Style.RESET_ALL}"
-            f"{Fore.WHITE + Style.BRIGHT} | {Style.RESET_ALL}{message}",
-            flush=True
+    def replace(self, telegram_id: str, kind: str, payload):
+        """Overwrite a cached payload with local edits without extending its TTL; a no-op once invalidated."""
+        self.conn.execute(
+            'UPDATE state SET payload = ? WHERE telegram_id = ? AND kind = ?',
+            (json.dumps(payload), telegram_id, kind)
+        )
+        self.conn.commit()
+
+    def invalidate(self, telegram_id: str, *kinds: str):
+        self.conn.executemany(
+            'DELETE FROM state WHERE telegram_id = ? AND kind = ?', [(telegram_id, kind) for kind in kinds]
         )
+        self.conn.commit()
+
+    def update_user(self, telegram_id: str, points: int = 0, **fields):
+        user = self.get(telegram_id, 'user')
+        if user is None or 'pointsCount' not in user:
+            return
+
+        user['pointsCount'] += points
+        user.update(fields)
+        self.replace(telegram_id, 'user', user)
+
+    def close(self):
+        self.conn.close()
+
+class ClaimJournal:
+    """Append-only write-ahead log of finished steps and claimed leagues/quests.
+
+    A step line ({"id", "key", "due"}) says the step ran and is not due again before
+    `due`; an item line ({"id", "key": "quest:7", "at"}) marks one claim inside a step
+    that has not finished yet and is dropped once that step's line is written. The file
+    is replayed on start and rewritten with only the live entries when it grows; a
+    `readonly` journal (used by --plan) is only replayed, never rewritten or appended to.
+    """
+    ITEMS = {'leagues': 'league:', 'quests': 'quest:'}
+
+    def __init__(self, path: str = 'journal.log', readonly: bool = False) -> None:
+        self.path = path
+        self.entries = {}
+        self.lines = 0
+        self.compact_at = JOURNAL_COMPACT_LINES
+        self.file = None
+        if path is None:
+            return
+
+        if os.path.exists(path):
+            with open(path, 'r') as file:
+                for line in file:
+                    try:
+                        self.apply(json.loads(line))
+                    except (ValueError, KeyError, TypeError):
+                        continue
+        if not readonly:
+            self.compact()
+
+    def apply(self, record: dict):
+        entries = self.entries.setdefault(record['id'], {})
+        key = record['key']
+        if 'due' in record:
+            prefix = self.ITEMS.get(key)
+            if prefix:
+                for item in [item for item in entries if item.startswith(prefix)]:
+                    del entries[item]
+            entries[key] = record['due']
+        else:
+            entries[key] = record['at']
+
+    def done(self, telegram_id: str, key: str):
+        value = self.entries.get(telegram_id, {}).get(key)
+        if value is None:
+            return False
+        return ':' in key or value > time.time()
+
+    def completed(self, telegram_id: str, steps):
+        """Return {step: due} for the steps already finished and not due again yet."""
+        entries = self.entries.get(telegram_id, {})
+        return {step: entries[step] for step in steps if self.done(telegram_id, step)}
+
+    def record(self, telegram_id: str, key: str, due: float = None):
+        record = {'id': telegram_id, 'key': key}
+        if due is not None:
+            record['due'] = due
+        else:
+            record['at'] = time.time()
+
+        self.apply(record)
+        if self.file is None:
+            return
+
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+        self.lines += 1
+        if self.lines >= self.compact_at:
+            self.compact()
+
+    def compact(self):
+        """Drop expired steps and stale items, then atomically rewrite the file with what is left."""
+        now = time.time()
+        for telegram_id in list(self.entries):
+            entries = self.entries[telegram_id]
+            for key, value in list(entries.items()):
+                if (now - value > JOURNAL_ITEM_TTL) if ':' in key else (value <= now):
+                    del entries[key]
+            if not entries:
+                del self.entries[telegram_id]
+
+        if self.file is not None:
+            self.file.close()
+
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w') as file:
+            for telegram_id, entries in self.entries.items():
+                for key, value in sorted(entries.items(), key=lambda entry: ':' in entry[0]):
+                    record = {'id': telegram_id, 'key': key, ('at' if ':' in key else 'due'): value}
+                    file.write(json.dumps(record) + '\n')
+        os.replace(temporary, self.path)
+
+        self.lines = sum(len(entries) for entries in self.entries.values())
+        self.compact_at = max(JOURNAL_COMPACT_LINES, 2 * self.lines)
+        self.file = open(self.path, 'a')
+
+    def close(self):
+        if self.file is not None:
+            self.compact()
+            self.file.close()
+            self.file = None
+
+class Catalog:
+    """Process-wide league and quest definitions shared by every account.
+
+    The definitions are the same for all users, so they are kept once here (and
+    persisted in the state store) while each account only caches its statuses.
+    """
+    MODELS = {'leagues': League, 'quests': Quest}
+
+    def __init__(self, state: StateStore) -> None:
+        self.state = state
+        saved = state.get('', 'catalog') or {}
+        self.leagues = {key: League.from_data(data) for key, data in saved.get('leagues', {}).items()}
+        self.quests = {key: Quest.from_data(data) for key, data in saved.get('quests', {}).items()}
+
+    def merge(self, kind: str, items: list):
+        """Fold one account's models into the shared definitions and return its {id: status} map."""
+        definitions = getattr(self, kind)
+        statuses = {}
+        changed = False
+        for item in items:
+            item_id = str(item.id)
+            statuses[item_id] = item.status
+            if definitions.get(item_id) != item:
+                definitions[item_id] = item
+                changed = True
+
+        if changed:
+            self.state.put('', 'catalog', {
+                kind: {item_id: item.to_data() for item_id, item in getattr(self, kind).items()} for kind in self.MODELS
+            })
+        return statuses
+
+    def knows(self, kind: str, item_ids):
+        definitions = getattr(self, kind)
+        return all(item_id in definitions for item_id in item_ids)
+
+    def next_league(self, league_id: str):
+        league_ids = list(self.leagues)
+        index = league_ids.index(league_id) + 1
+        return self.leagues[league_ids[index]] if index < len(league_ids) else None
+
+class DeadlineScheduler:
+    """Min-heap of accounts keyed on the earliest due time of their steps."""
+
+    def __init__(self) -> None:
+        self.heap = []
+        self.due = {}
+        self.in_flight = set()
+
+    def add(self, key: str, next_due: dict):
+        self.due[key] = dict.fromkeys(STEPS, 0.0)
+        self.schedule(key, next_due)
+
+    def schedule(self, key: str, next_due: dict):
+        self.in_flight.discard(key)
+        steps = self.due.get(key)
+        if steps is None:
+            return
+
+        steps.update(next_due)
+        heapq.heappush(self.heap, (min(steps.values()), key))
+
+    def remove(self, key: str):
+        self.due.pop(key, None)
+        self.in_flight.discard(key)
+
+    def is_stale(self, due_at: float, key: str):
+        steps = self.due.get(key)
+        return steps is None or key in self.in_flight or min(steps.values()) != due_at
+
+    def pop_due(self, now: float):
+        """Pop every account with a step due, together with the steps due within WAKE_SLACK."""
+        ready = []
+        while self.heap and self.heap[0][0] <= now:
+            due_at, key = heapq.heappop(self.heap)
+            if self.is_stale(due_at, key):
+                continue
+
+            steps = self.due[key]
+            self.in_flight.add(key)
+            ready.append((key, tuple(step for step in STEPS if steps[step] <= now + WAKE_SLACK)))
+        return ready
+
+    def next_wakeup(self):
+        while self.heap and self.is_stale(*self.heap[0]):
+            heapq.heappop(self.heap)
+        return self.heap[0][0] if self.heap else None
+
+class InitData:
+    """Telegram init data decoded from one query.txt line: the account it signs in as and when it was issued."""
+    __slots__ = ('telegram_id', 'username', 'auth_date')
+
+    def __init__(self, telegram_id: str, username: str = None, auth_date: int = None) -> None:
+        self.telegram_id = telegram_id
+        self.username = username
+        self.auth_date = auth_date
+
+    @classmethod
+    def parse(cls, query: str):
+        # Only `user` and `auth_date` are read, so split the line by hand instead of decoding every field with parse_qs.
+        user = auth_date = ''
+        for field in query.split('&'):
+            name, _, value = field.partition('=')
+            if name == 'user':
+                user = value
+            elif name == 'auth_date':
+                auth_date = value
+        if not user:
+            raise ValueError("User data not found in query.")
+
+        user_data = json.loads(urllib.parse.unquote(urllib.parse.unquote_plus(user)))
+        return cls(str(user_data['id']), user_data.get('username'), int(auth_date) if auth_date.isdigit() else None)
+
+    def is_stale(self, ttl: float, now: float):
+        """True once the data is older than `ttl` seconds; lines without auth_date, or ttl 0, never go stale."""
+        return bool(ttl) and self.auth_date is not None and now - self.auth_date > ttl
+
+class AccountSource:
+    """Streams query.txt lazily and hot-reloads it when its mtime changes.
+
+    Each line is parsed once and its InitData cached under the line's hash, so a
+    reload only diffs the set of lines and hands the scheduler what was added or removed.
+    Lines for a telegram id that appears more than once collapse to the one with the
+    newest auth_date (the later line on a tie).
+    """
+
+    def __init__(self, path: str = 'query.txt', shard: tuple = None) -> None:
+        self.path = path
+        self.shard = shard
+        self.mtime = None
+        self.checked_at = 0
+        self.init_data = {}
+        self.queries = {}
+        self.duplicates = 0
+        self.invalid = 0
+
+    def stream(self):
+        with open(self.path, 'r') as file:
+            for line in file:
+                line = line.strip()
+                if line:
+                    yield line
+
+    def key(self, query: str):
+        return hashlib.blake2b(query.encode(), digest_size=16).digest()
+
+    def parse(self, query: str):
+        key = self.key(query)
+        init_data = self.init_data.get(key)
+        if init_data is None:
+            init_data = self.init_data[key] = InitData.parse(query)
+        return init_data
+
+    def telegram_id(self, query: str):
+        return self.parse(query).telegram_id
+
+    def label(self, query: str):
+        """The line's telegram id, or a short hash of it when unparseable; never the line, which carries the auth hash."""
+        try:
+            return self.telegram_id(query)
+        except (ValueError, KeyError):
+            return f'line:{self.key(query).hex()[:8]}'
+
+    def owns(self, query: str):
+        if self.shard is None:
+            return True
+
+        worker, workers = self.shard
+        return shard_for(self.label(query), workers) == worker
+
+    def reload(self, force: bool = False):
+        """Return (added, removed) lines since the last reload; a no-op until the file's mtime changes."""
+        now = time.monotonic()
+        if not force and now - self.checked_at < ACCOUNT_RELOAD_INTERVAL:
+            return [], []
+
+        self.checked_at = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            # Mid-save or briefly missing: keep the current accounts and look again next interval.
+            return [], []
+        if mtime == self.mtime:
+            return [], []
+
+        self.mtime = mtime
+        current = {}
+        freshest = {}
+        dropped = []
+        invalid = 0
+        for query in self.stream():
+            if not self.owns(query):
+                continue
+
+            try:
+                init_data = self.parse(query)
+            except (ValueError, KeyError):
+                invalid += 1
+                continue
+
+            kept = freshest.get(init_data.telegram_id)
+            if kept is not None:
+                if (init_data.auth_date or 0) < (self.parse(kept).auth_date or 0):
+                    dropped.append(query)
+                    continue
+                dropped.append(kept)
+                del current[kept]
+            freshest[init_data.telegram_id] = query
+            current[query] = None
+
+        self.duplicates = len(dropped)
+        self.invalid = invalid
+        for query in dropped:
+            self.init_data.pop(self.key(query), None)
+        added = [query for query in current if query not in self.queries]
+        removed = [query for query in self.queries if query not in current]
+        for query in removed:
+            self.init_data.pop(self.key(query), None)
+
+        self.queries = current
+        return added, removed
+
+class CassetteRecorder:
+    """httpx transport wrapper that appends every exchange to a gzipped JSON-lines cassette.
+
+    Only the method, path, JSON body, status, a few response headers, the response body and
+    the elapsed time are kept. The Telegram-Data header is never written, and telegram ids and
+    names are replaced by stable per-cassette aliases.
+    """
+
+    def __init__(self, path: str, transport) -> None:
+        import gzip
+
+        self.transport = transport
+        self.file = gzip.open(path, 'at', encoding='utf-8')
+        self.aliases = {}
+
+    def alias(self, telegram_id):
+        return self.aliases.setdefault(str(telegram_id), str(100000001 + len(self.aliases)))
+
+    def scrub(self, value, alias: str):
+        if isinstance(value, dict):
+            return {
+                key: alias if key == 'telegramId' else f'user{alias}' if key in CASSETTE_PII and item else self.scrub(item, alias)
+                for key, item in value.items()
+            }
+        if isinstance(value, list):
+            return [self.scrub(item, alias) for item in value]
+        return value
+
+    async def handle_async_request(self, request):
+        started = time.monotonic()
+        response = await self.transport.handle_async_request(request)
+        await response.aread()
+        elapsed = time.monotonic() - started
+
+        params = dict(urllib.parse.parse_qsl(request.url.query.decode()))
+        body = json_loads(request.content) if request.content else None
+        telegram_id = params.get('telegramId') or (body or {}).get('telegramId')
+        alias = self.alias(telegram_id) if telegram_id is not None else None
+        if 'telegramId' in params:
+            params['telegramId'] = alias
+        try:
+            reply = json.dumps(self.scrub(json_loads(response.content), alias))
+        except ValueError:
+            reply = response.text
+
+        self.file.write(json.dumps({
+            'method': request.method,
+            'path': request.url.path + (f'?{urllib.parse.urlencode(params)}' if params else ''),
+            'body': self.scrub(body, alias),
+            'status': response.status_code,
+            'headers': {name: response.headers[name] for name in CASSETTE_HEADERS if name in response.headers},
+            'response': reply,
+            'elapsed': round(elapsed, 4)
+        }) + '\n')
+        return response
+
+    async def __aenter__(self):
+        await self.transport.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.transport.aclose()
+        if not self.file.closed:
+            self.file.close()
+
+class CassetteTransport:
+    """httpx transport that answers from a recorded cassette instead of the network.
+
+    Exchanges are replayed round-robin per (method, path), so any query.txt can be driven by the
+    recording, after sleeping the recorded latency times `scale` (0 replays without delay).
+    """
+
+    def __init__(self, path: str, scale: float = 1.0) -> None:
+        import gzip
+
+        entries = defaultdict(list)
+        with gzip.open(path, 'rt', encoding='utf-8') as file:
+            for line in file:
+                entry = json.loads(line)
+                entries[entry['method'], entry['path'].split('?', 1)[0]].append(entry)
+        self.entries = {key: itertools.cycle(recorded) for key, recorded in entries.items()}
+        self.scale = scale
+
+    async def handle_async_request(self, request):
+        entries = self.entries.get((request.method, request.url.path))
+        if entries is None:
+            return httpx.Response(404, json={'message': 'Not Found'}, request=request)
+
+        entry = next(entries)
+        if self.scale:
+            await asyncio.sleep(entry['elapsed'] * self.scale)
+        return httpx.Response(entry['status'], headers=entry['headers'], content=entry['response'].encode(), request=request)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def aclose(self):
+        pass
+
+class CycleProfiler:
+    """cProfile and tracemalloc over one cycle at a time, for catching CPU and allocation regressions.
+
+    Each `cycle()` writes `cycle-N.prof` (pstats) and `cycle-N.tracemalloc` (a tracemalloc
+    snapshot) to `directory` and returns the cycle's CPU time, peak traced memory and the lines
+    whose allocations grew the most since the previous cycle.
+    """
+
+    def __init__(self, directory: str, worker: int = None) -> None:
+        import cProfile
+        import tracemalloc
+
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.prefix = f'worker-{worker}.' if worker is not None else ''
+        self.cycles = 0
+        tracemalloc.start()
+        self.snapshot = tracemalloc.take_snapshot()
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def cycle(self):
+        import cProfile
+        import pstats
+        import tracemalloc
+
+        self.profile.disable()
+        self.cycles += 1
+        path = os.path.join(self.directory, f'{self.prefix}cycle-{self.cycles}')
+        self.profile.dump_stats(f'{path}.prof')
+        cpu = pstats.Stats(self.profile).total_tt
+
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, module.__file__) for module in (tracemalloc, cProfile, pstats)]
+        )
+        snapshot.dump(f'{path}.tracemalloc')
+        growth = [stat for stat in snapshot.compare_to(self.snapshot, 'lineno') if stat.size_diff > 0][:PROFILE_TOP]
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+
+        self.snapshot = snapshot
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        return {'path': path, 'cpu': cpu, 'peak': peak, 'growth': growth}
+
+class SnapsterAccount:
+    """Per-account request context: telegram id plus its own immutable auth headers."""
+    __slots__ = ('telegram_id', 'query', 'headers')
+
+    def __init__(self, telegram_id: str, query: str) -> None:
+        self.telegram_id = telegram_id
+        self.query = query
+        self.headers = MappingProxyType({
+            'Content-Type': 'application/json',
+            'Telegram-Data': query
+        })
+
+class SnapsterTradingApp:
+    def __init__(self, concurrency: int = 10, base_url: str = BASE_URL, state_path: str = 'state.db',
+                 rate: float = RATE_LIMIT, endpoint_rates: dict = None, worker: int = None, events=None,
+                 query_path: str = 'query.txt', shard: tuple = None, metrics_port: int = None,
+                 logger: 'LogPipeline' = None, dashboard: bool = False, journal_path: str = 'journal.log',
+                 init_data_ttl: float = INIT_DATA_TTL, http2: bool = False, record_path: str = None,
+                 replay_path: str = None, replay_scale: float = 1.0, profile_dir: str = None) -> None:
+        self.concurrency = concurrency
+        self.base_url = base_url
+        self.state_path = state_path
+        self.rate = rate
+        self.endpoint_rates = {**ENDPOINT_RATE_LIMITS, **(endpoint_rates or {})}
+        self.worker = worker
+        self.events = events
+        self.logger = logger
+        if logger is None and events is None:
+            self.logger = LogPipeline()
+        self.metrics_port = metrics_port
+        self.dashboard = dashboard
+        self.init_data_ttl = init_data_ttl
+        self.http2 = http2
+        self.http_version = None
+        self.record_path = record_path
+        self.replay_path = replay_path
+        self.replay_scale = replay_scale
+        self.profile_dir = profile_dir
+        self.profiler = None
+        self.stale = {}
+        self.invalid = 0
+        self.processed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.queued = 0
+        self.idle = False
+        self.session = None
+        self.accounts = AccountSource(query_path, shard)
+        self.limiter = RateLimiter(rate, self.endpoint_rates)
+        self.breakers = defaultdict(CircuitBreaker)
+        self.scheduler = DeadlineScheduler()
+        self.state = StateStore(state_path)
+        self.catalog = Catalog(self.state)
+        # The claim file is only opened by run(), so the workers parent never replays or compacts it.
+        self.journal_path = journal_path
+        self.journal = ClaimJournal(None)
+        self.metrics = Metrics()
+        self.flights = {}
+
+    def clear_terminal(self):
+        sys.stdout.write('\033[2J\033[H')
+        sys.stdout.flush()
+
+    def log(self, level: str, event: str, **fields):
+        """Queue a structured event; rendering and I/O happen on the log writer thread."""
+        if self.events is not None:
+            self.events.put(('log', self.worker, (time.time(), level, event, fields)))
+        elif self.logger.enabled(level):
+            self.logger.submit(LogEvent(time.time(), level, event, fields))
 
     def welcome(self):
         print(
@@ -48,562 +1369,1037 @@ class SnapsterTradingApp:
         )
 
     def format_seconds(self, seconds):
-        hours, remainder = divmod(seconds, 3600)
-        minutes, seconds = divmod(remainder, 60)
-        return f"{int(hours):02}:{int(minutes):02}:{int(seconds):02}"
+        return format_seconds(seconds)
 
     def load_data(self, query: str):
-        query_params = urllib.parse.parse_qs(query)
-        query = query_params.get('user', [None])[0]
-
-        if query:
-            user_data_json = urllib.parse.unquote(query)
-            user_data = json.loads(user_data_json)
-            telegram_id = user_data['id']
-            return telegram_id
-        else:
-            raise ValueError("User data not found in query.")
+        return self.accounts.telegram_id(query)
 
-    def get_user(self, telegram_id: str, query: str, retries=3, delay=2):
-        url = 'https://prod.snapster.bot/api/user/getUserByTelegramId'
-        data = json.dumps({'telegramId':telegram_id})
-        self.headers.update({ 
-            'Content-Type': 'application/json',
-            'Telegram-Data': query 
-        }) 
+    def parse_retry_after(self, value: str):
+        if not value:
+            return None
+        try:
+            return max(float(value), 0)
+        except ValueError:
+            pass
+        try:
+            from email.utils import parsedate_to_datetime
+            return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0)
+        except (TypeError, ValueError):
+            return None
 
-        for attempt in range(retries):
-            try:
-                response = self.session.post(url, headers=self.headers, data=data)
-                response.raise_for_status()
-                return response.json()
-            except (requests.RequestException, ValueError) as e:
-                if attempt < retries - 1:
-                    print(
-                        f"{Fore.RED + Style.BRIGHT}HTTP ERROR{Style.RESET_ALL}"
-                        f"{Fore.YELLOW + Style.BRIGHT} Retrying... {Style.RESET_ALL}"
-                        f"{Fore.WHITE + Style.BRIGHT}[{attempt+1}/{retries}]{Style.RESET_ALL}",
-                        end="\r",
-                        flush=True
-                    )
-                    time.sleep(delay)
-                else:
-                    return None
+    async def request(self, method: str, url: str, account: SnapsterAccount, payload: dict = None, retries=3):
+        """Send one API call, retrying transient failures with exponential backoff and full jitter.
 
-    def claim_daily(self, telegram_id: str, query: str, retries=3, delay=2):
-        url = 'https://prod.snapster.bot/api/dailyQuest/claimDailyQuestBonus'
-        data = json.dumps({'telegramId':telegram_id})
-        self.headers.update({ 
-            'Content-Type': 'application/json',
-            'Telegram-Data': query 
-        }) 
+        429/5xx and transport errors are retried (honouring Retry-After), other 4xx fail fast,
+        and the whole call including waits is bounded by REQUEST_DEADLINE seconds. Every
+        attempt first checks the endpoint's circuit breaker and takes a token from the
+        shared rate limiter.
+        """
+        data = json.dumps(payload) if payload is not None else None
+        endpoint = url.split('?', 1)[0].rsplit('/', 1)[-1]
+        deadline = time.monotonic() + REQUEST_DEADLINE
 
         for attempt in range(retries):
+            ticket = self.breakers[endpoint].allow()
+            if ticket is None:
+                self.metrics.skipped(endpoint)
+                return None
+
+            retry_after = None
+            await self.limiter.acquire(endpoint)
+            started = time.monotonic()
             try:
-                response = self.session.post(url, headers=self.headers, data=data)
+                timeout = min(REQUEST_TIMEOUT, max(deadline - time.monotonic(), 0.1))
+                response = await self.session.request(method, url, headers=account.headers, content=data, timeout=timeout)
+                self.limiter.feedback(endpoint, response.status_code)
+                if response.http_version != self.http_version:
+                    self.http_version = response.http_version
+                    self.log('INFO', 'http.version', version=self.http_version)
                 response.raise_for_status()
-                return response.json()
-            except (requests.RequestException, ValueError) as e:
-                if attempt < retries - 1:
-                    print(
-                        f"{Fore.RED + Style.BRIGHT}HTTP ERROR{Style.RESET_ALL}"
-                        f"{Fore.YELLOW + Style.BRIGHT} Retrying... {Style.RESET_ALL}"
-                        f"{Fore.WHITE + Style.BRIGHT}[{attempt+1}/{retries}]{Style.RESET_ALL}",
-                        end="\r",
-                        flush=True
-                    )
-                    time.sleep(delay)
-                else:
+                result = json_loads(response.content)
+                message = result.get('message') if isinstance(result, dict) else None
+                self.metrics.observe(endpoint, time.monotonic() - started, str(message))
+                self.breaker_result(endpoint, True, ticket)
+                return result
+            except httpx.HTTPStatusError as e:
+                self.metrics.observe(endpoint, time.monotonic() - started, f'HTTP {e.response.status_code}')
+                retryable = e.response.status_code in RETRYABLE_STATUS
+                self.breaker_result(endpoint, not retryable, ticket)
+                if not retryable:
                     return None
+                retry_after = self.parse_retry_after(e.response.headers.get('Retry-After'))
+            except (httpx.HTTPError, ValueError) as e:
+                self.metrics.observe(endpoint, time.monotonic() - started, type(e).__name__)
+                self.breaker_result(endpoint, False, ticket)
 
-    def get_leagues(self, telegram_id: str, query: str, retries=3, delay=2):
-        url = f'https://prod.snapster.bot/api/user/getLeagues?telegramId={telegram_id}'
-        self.headers.update({ 
-            'Content-Type': 'application/json',
-            'Telegram-Data': query 
-        }) 
+            if attempt == retries - 1:
+                return None
 
-        for attempt in range(retries):
-            try:
-                response = self.session.get(url, headers=self.headers)
-                response.raise_for_status()
-                return response.json()
-            except (requests.RequestException, ValueError) as e:
-                if attempt < retries - 1:
-                    print(
-                        f"{Fore.RED + Style.BRIGHT}HTTP ERROR{Style.RESET_ALL}"
-                        f"{Fore.YELLOW + Style.BRIGHT} Retrying... {Style.RESET_ALL}"
-                        f"{Fore.WHITE + Style.BRIGHT}[{attempt+1}/{retries}]{Style.RESET_ALL}",
-                        end="\r",
-                        flush=True
-                    )
-                    time.sleep(delay)
-                else:
-                    return None
-        
-    def claim_league(self, telegram_id: str, league_id: int, query: str, retries=3, delay=2):
-        url = 'https://prod.snapster.bot/api/user/claimLeagueBonus'
-        data = json.dumps({'telegramId':telegram_id, 'leagueId':league_id})
-        self.headers.update({ 
-            'Content-Type': 'application/json',
-            'Telegram-Data': query 
-        }) 
+            delay = retry_after if retry_after is not None else random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+            if time.monotonic() + delay >= deadline:
+                return None
 
-        for attempt in range(retries):
-            try:
-                response = self.session.post(url, headers=self.headers, data=data)
-                response.raise_for_status()
-                return response.json()
-            except (requests.RequestException, ValueError) as e:
-                if attempt < retries - 1:
-                    print(
-                        f"{Fore.RED + Style.BRIGHT}HTTP ERROR{Style.RESET_ALL}"
-                        f"{Fore.YELLOW + Style.BRIGHT} Retrying... {Style.RESET_ALL}"
-                        f"{Fore.WHITE + Style.BRIGHT}[{attempt+1}/{retries}]{Style.RESET_ALL}",
-                        end="\r",
-                        flush=True
-                    )
-                    time.sleep(delay)
-                else:
-                    return None
-        
-    def claim_refferal(self, telegram_id: str, query: str, retries=3, delay=2):
-        url = 'https://prod.snapster.bot/api/referral/claimReferralPoints'
-        data = json.dumps({'telegramId':telegram_id})
-        self.headers.update({ 
-            'Content-Type': 'application/json',
-            'Telegram-Data': query 
-        }) 
+            self.metrics.retry(endpoint)
+            self.log(
+                'WARNING', 'http.retry', telegram_id=account.telegram_id,
+                endpoint=endpoint, attempt=attempt + 1, retries=retries
+            )
+            await asyncio.sleep(delay)
 
-        for attempt in range(retries):
-            try:
-                response = self.session.post(url, headers=self.headers, data=data)
-                response.raise_for_status()
-                return response.json()
-            except (requests.RequestException, ValueError) as e:
-                if attempt < retries - 1:
-                    print(
-                        f"{Fore.RED + Style.BRIGHT}HTTP ERROR{Style.RESET_ALL}"
-                        f"{Fore.YELLOW + Style.BRIGHT} Retrying... {Style.RESET_ALL}"
-                        f"{Fore.WHITE + Style.BRIGHT}[{attempt+1}/{retries}]{Style.RESET_ALL}",
-                        end="\r",
-                        flush=True
-                    )
-                    time.sleep(delay)
-                else:
-                    return None
-        
-    def claim_mining(self, telegram_id: str, query: str, retries=3, delay=2):
-        url = 'https://prod.snapster.bot/api/user/claimMiningBonus'
-        data = json.dumps({'telegramId':telegram_id})
-        self.headers.update({ 
-            'Content-Type': 'application/json',
-            'Telegram-Data': query 
-        }) 
+    def breaker_result(self, endpoint: str, healthy: bool, ticket=True):
+        breaker = self.breakers[endpoint]
+        if healthy:
+            if breaker.success(ticket):
+                self.log('INFO', 'breaker.closed', endpoint=endpoint)
+        elif breaker.failure(ticket):
+            self.log('WARNING', 'breaker.opened', endpoint=endpoint, retry_at=breaker.opened_at + BREAKER_COOLDOWN)
 
-        for attempt in range(retries):
-            try:
-                response = self.session.post(url, headers=self.headers, data=data)
-                response.raise_for_status()
-                return response.json()
-            except (requests.RequestException, ValueError) as e:
-                if attempt < retries - 1:
-                    print(
-                        f"{Fore.RED + Style.BRIGHT}HTTP ERROR{Style.RESET_ALL}"
-                        f"{Fore.YELLOW + Style.BRIGHT} Retrying... {Style.RESET_ALL}"
-                        f"{Fore.WHITE + Style.BRIGHT}[{attempt+1}/{retries}]{Style.RESET_ALL}",
-                        end="\r",
-                        flush=True
-                    )
-                    time.sleep(delay)
-                else:
-                    return None
-        
-    def get_quests(self, telegram_id: str, query: str, retries=3, delay=2):
-        url = f'https://prod.snapster.bot/api/quest/getQuests?telegramId={telegram_id}'
-        self.headers.update({ 
-            'Content-Type': 'application/json',
-            'Telegram-Data': query 
-        }) 
+    def blocked_steps(self, steps):
+        """Return {step: (endpoint, retry_at)} for steps that need an endpoint whose breaker is open.
 
-        for attempt in range(retries):
-            try:
-                response = self.session.get(url, headers=self.headers)
-                response.raise_for_status()
-                return response.json()
-            except (requests.RequestException, ValueError) as e:
-                if attempt < retries - 1:
-                    print(
-                        f"{Fore.RED + Style.BRIGHT}HTTP ERROR{Style.RESET_ALL}"
-                        f"{Fore.YELLOW + Style.BRIGHT} Retrying... {Style.RESET_ALL}"
-                        f"{Fore.WHITE + Style.BRIGHT}[{attempt+1}/{retries}]{Style.RESET_ALL}",
-                        end="\r",
-                        flush=True
-                    )
-                    time.sleep(delay)
-                else:
-                    return None
-        
-    def start_quests(self, telegram_id: str, quest_id: int, query: str, retries=3, delay=2):
-        url = 'https://prod.snapster.bot/api/quest/startQuest'
-        data = json.dumps({'telegramId':telegram_id, 'questId':quest_id})
-        self.headers.update({ 
-            'Content-Type': 'application/json',
-            'Telegram-Data': query
-        }) 
+        retry_at is spread over one extra cooldown so the skipped accounts do not all come back at once.
+        """
+        blocked = {}
+        for step in steps:
+            step = STEP_REGISTRY[step]
+            for endpoint in (*(NEED_ENDPOINTS[need] for need in step.needs), *step.endpoints):
+                retry_at = self.breakers[endpoint].retry_at()
+                if retry_at is not None:
+                    blocked[step.name] = (endpoint, retry_at + random.uniform(0, BREAKER_COOLDOWN))
+                    break
+        return blocked
 
-        for attempt in range(retries):
-            try:
-                response = self.session.post(url, headers=self.headers, data=data)
-                response.raise_for_status()
-                return response.json()
-            except (requests.RequestException, ValueError) as e:
-                if attempt < retries - 1:
-                    print(
-                        f"{Fore.RED + Style.BRIGHT}HTTP ERROR{Style.RESET_ALL}"
-                        f"{Fore.YELLOW + Style.BRIGHT} Retrying... {Style.RESET_ALL}"
-                        f"{Fore.WHITE + Style.BRIGHT}[{attempt+1}/{retries}]{Style.RESET_ALL}",
-                        end="\r",
-                        flush=True
-                    )
-                    time.sleep(delay)
-                else:
-                    return None
-        
-    def claim_quests(self, telegram_id: str, quest_id: int, query: str, retries=3, delay=2):
-        url = 'https://prod.snapster.bot/api/quest/claimQuestBonus'
-        data = json.dumps({'telegramId':telegram_id, 'questId':quest_id})
-        self.headers.update({ 
-            'Content-Type': 'application/json',
-            'Telegram-Data': query 
-        }) 
+    async def get_user(self, account: SnapsterAccount, retries=3):
+        body = await self.request('POST', '/api/user/getUserByTelegramId', account, {'telegramId': account.telegram_id}, retries)
+        data = unwrap(body, Message.USER_FETCHED)
+        return User.from_data(data) if data else None
 
-        for attempt in range(retries):
-            try:
-                response = self.session.post(url, headers=self.headers, data=data)
-                response.raise_for_status()
-                return response.json()
-            except (requests.RequestException, ValueError) as e:
-                if attempt < retries - 1:
-                    print(
-                        f"{Fore.RED + Style.BRIGHT}HTTP ERROR{Style.RESET_ALL}"
-                        f"{Fore.YELLOW + Style.BRIGHT} Retrying... {Style.RESET_ALL}"
-                        f"{Fore.WHITE + Style.BRIGHT}[{attempt+1}/{retries}]{Style.RESET_ALL}",
-                        end="\r",
-                        flush=True
-                    )
-                    time.sleep(delay)
-                else:
-                    return None
-    
-    def process_query(self, query: str):
+    async def claim_daily(self, account: SnapsterAccount, retries=3):
+        body = await self.request('POST', '/api/dailyQuest/claimDailyQuestBonus', account, {'telegramId': account.telegram_id}, retries)
+        return ClaimResult.from_body(body)
 
-        telegram_id = str(self.load_data(query))
-        if not telegram_id:
-            self.log(
-                f"{Fore.MAGENTA + Style.BRIGHT}[ Account ID{Style.RESET_ALL}"
-                f"{Fore.WHITE + Style.BRIGHT} {telegram_id} {Style.RESET_ALL}"
-                f"{Fore.MAGENTA + Style.BRIGHT}] [ Status{Style.RESET_ALL}"
-                f"{Fore.RED + Style.BRIGHT} Login Failed {Style.RESET_ALL}"
-                f"{Fore.MAGENTA + Style.BRIGHT}]{Style.RESET_ALL}"
-            )
-            return
-        
-        if telegram_id:
-            user = self.get_user(telegram_id, query)
-            if user and user['message'] == 'Successfully fetched User':
+    async def get_leagues(self, account: SnapsterAccount, retries=3):
+        body = await self.request('GET', f'/api/user/getLeagues?telegramId={account.telegram_id}', account, retries=retries)
+        data = unwrap(body, Message.LEAGUES_FETCHED)
+        return [League.from_data(item) for item in data] if data is not None else None
+
+    async def claim_league(self, account: SnapsterAccount, league_id: int, retries=3):
+        body = await self.request('POST', '/api/user/claimLeagueBonus', account, {'telegramId': account.telegram_id, 'leagueId': league_id}, retries)
+        return ClaimResult.from_body(body)
+
+    async def claim_refferal(self, account: SnapsterAccount, retries=3):
+        body = await self.request('POST', '/api/referral/claimReferralPoints', account, {'telegramId': account.telegram_id}, retries)
+        return ClaimResult.from_body(body)
+
+    async def claim_mining(self, account: SnapsterAccount, retries=3):
+        body = await self.request('POST', '/api/user/claimMiningBonus', account, {'telegramId': account.telegram_id}, retries)
+        return ClaimResult.from_body(body)
+
+    async def get_quests(self, account: SnapsterAccount, retries=3):
+        body = await self.request('GET', f'/api/quest/getQuests?telegramId={account.telegram_id}', account, retries=retries)
+        data = unwrap(body, Message.QUESTS_FETCHED)
+        return [Quest.from_data(item) for item in data] if data is not None else None
+
+    async def start_quests(self, account: SnapsterAccount, quest_id: int, retries=3):
+        body = await self.request('POST', '/api/quest/startQuest', account, {'telegramId': account.telegram_id, 'questId': quest_id}, retries)
+        return ClaimResult.from_body(body)
+
+    async def claim_quests(self, account: SnapsterAccount, quest_id: int, retries=3):
+        body = await self.request('POST', '/api/quest/claimQuestBonus', account, {'telegramId': account.telegram_id, 'questId': quest_id}, retries)
+        return ClaimResult.from_body(body)
+
+    async def single_flight(self, key: tuple, call):
+        """Await `call()` once for every concurrent caller with the same (endpoint, telegram id) key.
+
+        Later callers share the first one's result instead of sending a duplicate request, and
+        are shielded so that cancelling one of them does not cancel the call for the others.
+        """
+        task = self.flights.get(key)
+        if task is None:
+            task = self.flights[key] = asyncio.ensure_future(call())
+            task.add_done_callback(lambda _: self.flights.pop(key, None))
+        else:
+            self.metrics.coalesced(key[0])
+        return await asyncio.shield(task)
+
+    async def fetch_user(self, account: SnapsterAccount):
+        cached = self.state.get(account.telegram_id, 'user', STATE_TTL['user'])
+        if cached is not None and 'pointsCount' in cached:
+            return User.from_data(cached)
+
+        user = await self.single_flight(('getUserByTelegramId', account.telegram_id), lambda: self.get_user(account))
+        if user is not None:
+            self.state.put(account.telegram_id, 'user', user.to_data())
+        return user
+
+    async def fetch_leagues(self, account: SnapsterAccount):
+        leagues = self.state.get(account.telegram_id, 'leagues', STATE_TTL['leagues'])
+        if leagues is None or not self.catalog.knows('leagues', leagues):
+            response = await self.single_flight(('getLeagues', account.telegram_id), lambda: self.get_leagues(account))
+            if response is None:
+                return None
+
+            statuses = self.catalog.merge('leagues', response)
+            leagues = {league_id: {'status': status} for league_id, status in statuses.items()}
+            self.state.put(account.telegram_id, 'leagues', leagues)
+        return leagues
+
+    async def fetch_quests(self, account: SnapsterAccount):
+        quests = self.state.get(account.telegram_id, 'quests', STATE_TTL['quests'])
+        if quests is None or not self.catalog.knows('quests', quests):
+            response = await self.single_flight(('getQuests', account.telegram_id), lambda: self.get_quests(account))
+            if response is None:
+                return None
+
+            quests = self.catalog.merge('quests', response)
+            self.state.put(account.telegram_id, 'quests', quests)
+        return quests
+
+    def credit(self, telegram_id: str, points: int, user: User = None, **fields):
+        """Book claimed points on the cached user and in the cycle metrics.
+
+        `user` is the in-memory User of the running pass, kept in step so later steps (leagues after daily) see the points.
+        """
+        self.state.update_user(telegram_id, points, **fields)
+        if user is not None:
+            user.points += points
+        self.metrics.claimed(points)
+
+    async def process_quests(self, account: SnapsterAccount, quests: dict):
+        """Start every EARN quest concurrently, then claim the started and UNCLAIMED ones as a batch.
+
+        Calls are capped at QUEST_CONCURRENCY per account; results are logged in quest order at the end.
+        """
+        semaphore = asyncio.Semaphore(QUEST_CONCURRENCY)
+
+        async def limited(call, quest_key):
+            async with semaphore:
+                return await call(account, self.catalog.quests[quest_key].id)
+
+        for quest_key in quests:
+            if self.journal.done(account.telegram_id, f'quest:{quest_key}'):
+                quests[quest_key] = 'CLAIMED'
+
+        earn = [quest_key for quest_key, status in quests.items() if status == 'EARN']
+        starts = dict(zip(earn, await asyncio.gather(*(limited(self.start_quests, quest_key) for quest_key in earn))))
+        claimable = [
+            quest_key for quest_key, status in quests.items()
+            if status == 'UNCLAIMED' or (starts.get(quest_key) and starts[quest_key].message is Message.QUEST_STARTED)
+        ]
+        claims = dict(zip(claimable, await asyncio.gather(*(limited(self.claim_quests, quest_key) for quest_key in claimable))))
+
+        for quest_key, status in list(quests.items()):
+            quest = self.catalog.quests[quest_key]
+            if status == 'EARN':
+                if quest_key not in claims:
+                    self.state.invalidate(account.telegram_id, 'quests')
+                    self.log('WARNING', 'quest.not_started', telegram_id=account.telegram_id, quest=quest.title)
+                    continue
+
+                self.log('INFO', 'quest.started', telegram_id=account.telegram_id, quest=quest.title)
+
+            if quest_key not in claims:
+                continue
+
+            claim = claims[quest_key]
+            if claim and claim.message is Message.QUEST_CLAIMED:
+                quests[quest_key] = 'CLAIMED'
+                self.journal.record(account.telegram_id, f'quest:{quest_key}')
+                self.credit(account.telegram_id, claim.points)
                 self.log(
-                    f"{Fore.MAGENTA+Style.BRIGHT}[ Account{Style.RESET_ALL}"
-                    f"{Fore.WHITE+Style.BRIGHT} {user['data']['username']} {Style.RESET_ALL}"
-                    f"{Fore.MAGENTA+Style.BRIGHT}]{Style.RESET_ALL}"
-                    f"{Fore.MAGENTA+Style.BRIGHT}[ Points{Style.RESET_ALL}"
-                    f"{Fore.WHITE+Style.BRIGHT} {user['data']['pointsCount']} $SNAPS {Style.RESET_ALL}"
-                    f"{Fore.MAGENTA+Style.BRIGHT}]{Style.RESET_ALL}"
-                    f"{Fore.MAGENTA+Style.BRIGHT}[ League{Style.RESET_ALL}"
-                    f"{Fore.WHITE+Style.BRIGHT} {user['data']['currentLeague']['title']} {Style.RESET_ALL}"
-                    f"{Fore.MAGENTA+Style.BRIGHT}]{Style.RESET_ALL}"
+                    'INFO', 'quest.claimed', telegram_id=account.telegram_id,
+                    quest=quest.title, points=claim.points
                 )
-                time.sleep(3)
+            elif claim and claim.message is Message.QUEST_ALREADY_CLAIMED:
+                quests[quest_key] = 'CLAIMED'
+                self.journal.record(account.telegram_id, f'quest:{quest_key}')
+                self.log('INFO', 'quest.already_claimed', telegram_id=account.telegram_id, quest=quest.title)
+            else:
+                self.state.invalidate(account.telegram_id, 'quests')
+                self.log('WARNING', 'quest.failed', telegram_id=account.telegram_id, quest=quest.title)
 
-                now_utc = datetime.utcnow().replace(tzinfo=pytz.utc)
-                last_checkin = user['data']['lastDailyBonusClaimDate']
-                if last_checkin:
-                    last_checkin_utc = datetime.strptime(last_checkin, "%Y-%m-%dT%H:%M:%S.%fZ").replace(tzinfo=pytz.utc) + timedelta(hours=24)
-                else:
-                    last_checkin_utc = now_utc
-                    
-                last_checkin_wib = last_checkin_utc.astimezone(wib).strftime('%x %X %Z')
+    def daily_due(self, user: User):
+        last_checkin = user.last_daily_claim
+        if not last_checkin:
+            return None
 
-                if now_utc >= last_checkin_utc:
-                    claim_daily = self.claim_daily(telegram_id, query)
-                    if claim_daily and claim_daily['message'] == 'Successfully claimed Daily Bonus points':
-                        self.log(
-                            f"{Fore.MAGENTA+Style.BRIGHT}[ Check-In{Style.RESET_ALL}"
-                            f"{Fore.GREEN+Style.BRIGHT} Is Claimed {Style.RESET_ALL}"
-                            f"{Fore.MAGENTA+Style.BRIGHT}] [ Rewards{Style.RESET_ALL}"
-                            f"{Fore.WHITE+Style.BRIGHT} {claim_daily['data']['pointsClaimed']} $SNAPS {Style.RESET_ALL}"
-                            f"{Fore.MAGENTA+Style.BRIGHT}]{Style.RESET_ALL}"
-                        )
-                    else:
-                        self.log(
-                            f"{Fore.MAGENTA+Style.BRIGHT}[ Check-In{Style.RESET_ALL}"
-                            f"{Fore.RED+Style.BRIGHT} Isn't Claimed {Style.RESET_ALL}"
-                            f"{Fore.MAGENTA+Style.BRIGHT}]{Style.RESET_ALL}"
-                        )
-                else:
-                    self.log(
-                        f"{Fore.MAGENTA+Style.BRIGHT}[ Check-In{Style.RESET_ALL}"
-                        f"{Fore.YELLOW+Style.BRIGHT} Is Already Claimed {Style.RESET_ALL}"
-                        f"{Fore.MAGENTA+Style.BRIGHT}] [ Next Claim at{Style.RESET_ALL}"
-                        f"{Fore.WHITE+Style.BRIGHT} {last_checkin_wib} {Style.RESET_ALL}"
-                        f"{Fore.MAGENTA+Style.BRIGHT}]{Style.RESET_ALL}"
-                    )
-                time.sleep(3)
-                
-                leagues = self.get_leagues(telegram_id, query)
-                if leagues and leagues['message'] == 'Successfully fetched Leagues':
-                    for i, league in enumerate(leagues['data']):
-                        league_id = league['leagueId']
-                        status = league['status']
-
-                        if league and status in ['CURRENT', 'UNCLAIMED']:
-                            claim_league = self.claim_league(telegram_id, league_id, query)                           
-                            if claim_league and claim_league['message'] == 'Successfully claimed Referral points':
-                                self.log(
-                                    f"{Fore.MAGENTA+Style.BRIGHT}[ League Bonus{Style.RESET_ALL}"
-                                    f"{Fore.WHITE+Style.BRIGHT} {league['title']} {Style.RESET_ALL}"
-                                    f"{Fore.GREEN+Style.BRIGHT}Is Claimed{Style.RESET_ALL}"
-                                    f"{Fore.MAGENTA+Style.BRIGHT} ] [ Rewards{Style.RESET_ALL}"
-                                    f"{Fore.WHITE+Style.BRIGHT} {claim_league['data']['pointsClaimed']} $SNAPS {Style.RESET_ALL}"
-                                    f"{Fore.MAGENTA+Style.BRIGHT}]{Style.RESET_ALL}"
-                                )
-                            elif claim_league and claim_league['message'] == 'Not eligible for claiming bonus':
-                                if i + 1 < len(leagues['data']):
-                                    next_league = leagues['data'][i + 1]
-                                    next_title = next_league['title']
-                                    required_points = next_league['requiredNumberOfPointsToAchieve']
-                                    current_points = user['data']['pointsCount']
-                                    less_points = required_points - current_points
-
-                                    self.log(
-                                        f"{Fore.MAGENTA+Style.BRIGHT}[ League Bonus{Style.RESET_ALL}"
-                                        f"{Fore.WHITE+Style.BRIGHT} {next_title} {Style.RESET_ALL}"
-                                        f"{Fore.YELLOW+Style.BRIGHT}Not Eligible{Style.RESET_ALL}"
-                                        f"{Fore.MAGENTA+Style.BRIGHT} ] [ Reason{Style.RESET_ALL}"
-                                        f"{Fore.WHITE+Style.BRIGHT} -{less_points} $SNAPS {Style.RESET_ALL}"
-                                        f"{Fore.MAGENTA+Style.BRIGHT}]{Style.RESET_ALL}"
-                                    )
-                                else:
-                                    self.log(
-                                        f"{Fore.MAGENTA + Style.BRIGHT}[ League{Style.RESET_ALL}"
-                                        f"{Fore.YELLOW + Style.BRIGHT} Already Reached Max Level {Style.RESET_ALL}"
-                                        f"{Fore.MAGENTA + Style.BRIGHT}]{Style.RESET_ALL}"
-                                    )
-                            else:
-                                self.log(
-                                    f"{Fore.MAGENTA+Style.BRIGHT}[ League Bonus{Style.RESET_ALL}"
-                                    f"{Fore.WHITE+Style.BRIGHT} {league['title']} {Style.RESET_ALL}"
-                                    f"{Fore.RED+Style.BRIGHT}Isn't Claimed{Style.RESET_ALL}"
-                                    f"{Fore.MAGENTA+Style.BRIGHT} ]{Style.RESET_ALL}"
-                                )
-                            time.sleep(1)
+        next_claim = parse_timestamp(last_checkin) + STEP_REGISTRY['daily'].interval
+        return next_claim if time.time() < next_claim else None
 
-                else:
-                    self.log(
-                        f"{Fore.MAGENTA + Style.BRIGHT}[ League{Style.RESET_ALL}"
-                        f"{Fore.RED + Style.BRIGHT} Data Is None {Style.RESET_ALL}"
-                        f"{Fore.MAGENTA + Style.BRIGHT}]{Style.RESET_ALL}"
-                    )
-                time.sleep(3)
+    async def run_daily(self, account: SnapsterAccount, user: User):
+        claim_daily = await self.claim_daily(account)
+        if claim_daily and claim_daily.message is Message.DAILY_CLAIMED:
+            user.last_daily_claim = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+            self.credit(account.telegram_id, claim_daily.points, user, lastDailyBonusClaimDate=user.last_daily_claim)
+            self.log('INFO', 'daily.claimed', telegram_id=account.telegram_id, points=claim_daily.points)
+            return True
 
-                claim_refferal = self.claim_refferal(telegram_id, query)
-                if claim_refferal and claim_refferal['message'] == 'Successfully claimed Referral points':
-                    rewards = claim_refferal['data']['pointsClaimed']
-                    if rewards > 0:
-                        self.log(
-                            f"{Fore.MAGENTA+Style.BRIGHT}[ Refferal{Style.RESET_ALL}"
-                            f"{Fore.GREEN+Style.BRIGHT} Is Claimed {Style.RESET_ALL}"
-                            f"{Fore.MAGENTA+Style.BRIGHT}] [ Rewards{Style.RESET_ALL}"
-                            f"{Fore.WHITE+Style.BRIGHT} {rewards} $SNAPS {Style.RESET_ALL}"
-                            f"{Fore.MAGENTA+Style.BRIGHT}]{Style.RESET_ALL}"
-                        )
-                    else:
-                        self.log(
-                            f"{Fore.MAGENTA+Style.BRIGHT}[ Refferal{Style.RESET_ALL}"
-                            f"{Fore.YELLOW+Style.BRIGHT} Not Available Points {Style.RESET_ALL}"
-                            f"{Fore.MAGENTA+Style.BRIGHT}]{Style.RESET_ALL}"
-                        )
-                else:
+        # The cached user still says daily is due; refetch it instead of retrying on stale data until the TTL runs out.
+        self.state.invalidate(account.telegram_id, 'user')
+        self.log('WARNING', 'daily.failed', telegram_id=account.telegram_id)
+        return False
+
+    async def run_leagues(self, account: SnapsterAccount, user: User):
+        telegram_id = account.telegram_id
+        leagues = await self.fetch_leagues(account)
+        if leagues is None:
+            self.log('WARNING', 'leagues.missing', telegram_id=telegram_id)
+            return False
+
+        for league_id, league in self.catalog.leagues.items():
+            entry = leagues.get(league_id)
+            if entry is None:
+                continue
+
+            if self.journal.done(telegram_id, f'league:{league_id}'):
+                entry['status'] = 'CLAIMED'
+
+            status = entry['status']
+            if status == 'NOT_ELIGIBLE':
+                eligible_at = entry.get('eligibleAt')
+                if eligible_at is None or user.points < eligible_at:
+                    continue
+
+            if status in ['CURRENT', 'UNCLAIMED', 'NOT_ELIGIBLE']:
+                claim_league = await self.claim_league(account, league.id)
+                if claim_league and claim_league.message is Message.REFERRAL_CLAIMED:
+                    entry['status'] = 'CLAIMED'
+                    self.credit(telegram_id, claim_league.points, user)
+                    self.journal.record(telegram_id, f'league:{league_id}')
                     self.log(
-                        f"{Fore.MAGENTA+Style.BRIGHT}[ Refferal{Style.RESET_ALL}"
-                        f"{Fore.RED+Style.BRIGHT} Isn't Claimed {Style.RESET_ALL}"
-                        f"{Fore.MAGENTA+Style.BRIGHT}]{Style.RESET_ALL}"
+                        'INFO', 'league.claimed', telegram_id=telegram_id,
+                        league=league.title, points=claim_league.points
                     )
-                time.sleep(3)
-                
-                claim_mining = self.claim_mining(telegram_id, query)
-                if claim_mining and claim_mining['message'] == 'Successfully claimed Mining Bonus points':
-                    rewards = claim_mining['data']['pointsClaimed']
-                    if rewards > 0:
+                elif claim_league and claim_league.message is Message.NOT_ELIGIBLE:
+                    entry['status'] = 'NOT_ELIGIBLE'
+                    entry['eligibleAt'] = None
+                    next_league = self.catalog.next_league(league_id)
+                    if next_league:
+                        next_title = next_league.title
+                        required_points = next_league.required_points
+                        current_points = user.points
+                        less_points = required_points - current_points
+                        entry['eligibleAt'] = required_points
+
                         self.log(
-                            f"{Fore.MAGENTA+Style.BRIGHT}[ Mining{Style.RESET_ALL}"
-                            f"{Fore.GREEN+Style.BRIGHT} Is Claimed {Style.RESET_ALL}"
-                            f"{Fore.MAGENTA+Style.BRIGHT}] [ Rewards{Style.RESET_ALL}"
-                            f"{Fore.WHITE+Style.BRIGHT} {rewards} $SNAPS {Style.RESET_ALL}"
-                            f"{Fore.MAGENTA+Style.BRIGHT}]{Style.RESET_ALL}"
+                            'INFO', 'league.not_eligible', telegram_id=telegram_id,
+                            league=next_title, missing=less_points
                         )
                     else:
-                        self.log(
-                            f"{Fore.MAGENTA+Style.BRIGHT}[ Mining{Style.RESET_ALL}"
-                            f"{Fore.YELLOW+Style.BRIGHT} Not Available Points {Style.RESET_ALL}"
-                            f"{Fore.MAGENTA+Style.BRIGHT}]{Style.RESET_ALL}"
-                        )
+                        self.log('INFO', 'league.max_level', telegram_id=telegram_id)
                 else:
-                    self.log(
-                        f"{Fore.MAGENTA+Style.BRIGHT}[ Mining{Style.RESET_ALL}"
-                        f"{Fore.RED+Style.BRIGHT} Isn't Claimed {Style.RESET_ALL}"
-                        f"{Fore.MAGENTA+Style.BRIGHT}]{Style.RESET_ALL}"
-                    )
-                time.sleep(3)
-
-                quests = self.get_quests(telegram_id, query)
-                if quests and quests['message'] == 'Successfully fetched Quests for User':
-                    for quest in quests['data']:
-                        quest_id = quest['id']
-                        status = quest['status']
-
-                        if quest and status == 'EARN':
-                            start = self.start_quests(telegram_id, quest_id, query)
-                            if start and start['message'] == 'Successfully started Quest earn':
-                                self.log(
-                                    f"{Fore.MAGENTA+Style.BRIGHT}[ Quest{Style.RESET_ALL}"
-                                    f"{Fore.WHITE+Style.BRIGHT} {quest['title']} {Style.RESET_ALL}"
-                                    f"{Fore.GREEN+Style.BRIGHT}Is Started{Style.RESET_ALL}"
-                                    f"{Fore.MAGENTA+Style.BRIGHT} ]{Style.RESET_ALL}"
-                                )
-
-                                claim = self.claim_quests(telegram_id, quest_id, query)
-                                if claim and claim['message'] == 'Successfully claimed Quest points':
-                                    self.log(
-                                        f"{Fore.MAGENTA+Style.BRIGHT}[ Quest{Style.RESET_ALL}"
-                                        f"{Fore.WHITE+Style.BRIGHT} {quest['title']} {Style.RESET_ALL}"
-                                        f"{Fore.GREEN+Style.BRIGHT}Is Claimed{Style.RESET_ALL}"
-                                        f"{Fore.MAGENTA+Style.BRIGHT} ] [ Rewards{Style.RESET_ALL}"
-                                        f"{Fore.WHITE+Style.BRIGHT} {claim['data']['pointsClaimed']} $SNAPS {Style.RESET_ALL}"
-                                        f"{Fore.MAGENTA+Style.BRIGHT}]{Style.RESET_ALL}"
-                                    )
-                                elif claim and claim['message'] == 'Not possible to claim bonus for this quest':
-                                    self.log(
-                                        f"{Fore.MAGENTA+Style.BRIGHT}[ Quest{Style.RESET_ALL}"
-                                        f"{Fore.WHITE+Style.BRIGHT} {quest['title']} {Style.RESET_ALL}"
-                                        f"{Fore.YELLOW+Style.BRIGHT}Is Already Claimed{Style.RESET_ALL}"
-                                        f"{Fore.MAGENTA+Style.BRIGHT} ]{Style.RESET_ALL}"
-                                    )
-                                else:
-                                    self.log(
-                                    f"{Fore.MAGENTA+Style.BRIGHT}[ Quest{Style.RESET_ALL}"
-                                    f"{Fore.WHITE+Style.BRIGHT} {quest['title']} {Style.RESET_ALL}"
-                                    f"{Fore.RED+Style.BRIGHT}Isn't Claimed{Style.RESET_ALL}"
-                                    f"{Fore.MAGENTA+Style.BRIGHT} ]{Style.RESET_ALL}"
-                                    )
-
-                            else:
-                                self.log(
-                                    f"{Fore.MAGENTA+Style.BRIGHT}[ Quest{Style.RESET_ALL}"
-                                    f"{Fore.WHITE+Style.BRIGHT} {quest['title']} {Style.RESET_ALL}"
-                                    f"{Fore.RED+Style.BRIGHT}Isn't Started{Style.RESET_ALL}"
-                                    f"{Fore.MAGENTA+Style.BRIGHT} ]{Style.RESET_ALL}"
-                                )
-
-                        elif status == 'UNCLAIMED':
-                            claim = self.claim_quests(telegram_id, quest_id, query)
-                            if claim and claim['message'] == 'Successfully claimed Quest points':
-                                self.log(
-                                    f"{Fore.MAGENTA+Style.BRIGHT}[ Quest{Style.RESET_ALL}"
-                                    f"{Fore.WHITE+Style.BRIGHT} {quest['title']} {Style.RESET_ALL}"
-                                    f"{Fore.GREEN+Style.BRIGHT}Is Claimed{Style.RESET_ALL}"
-                                    f"{Fore.MAGENTA+Style.BRIGHT} ] [ Rewards{Style.RESET_ALL}"
-                                    f"{Fore.WHITE+Style.BRIGHT} {claim['data']['pointsClaimed']} $SNAPS {Style.RESET_ALL}"
-                                    f"{Fore.MAGENTA+Style.BRIGHT}]{Style.RESET_ALL}"
-                                )
-                            elif claim and claim['message'] == 'Not possible to claim bonus for this quest':
-                                self.log(
-                                    f"{Fore.MAGENTA+Style.BRIGHT}[ Quest{Style.RESET_ALL}"
-                                    f"{Fore.WHITE+Style.BRIGHT} {quest['title']} {Style.RESET_ALL}"
-                                    f"{Fore.YELLOW+Style.BRIGHT}Is Already Claimed{Style.RESET_ALL}"
-                                    f"{Fore.MAGENTA+Style.BRIGHT} ]{Style.RESET_ALL}"
-                                )
-                            else:
-                                self.log(
-                                f"{Fore.MAGENTA+Style.BRIGHT}[ Quest{Style.RESET_ALL}"
-                                f"{Fore.WHITE+Style.BRIGHT} {quest['title']} {Style.RESET_ALL}"
-                                f"{Fore.RED+Style.BRIGHT}Isn't Claimed{Style.RESET_ALL}"
-                                f"{Fore.MAGENTA+Style.BRIGHT} ]{Style.RESET_ALL}"
-                                )
+                    self.state.invalidate(telegram_id, 'leagues')
+                    self.log('WARNING', 'league.failed', telegram_id=telegram_id, league=league.title)
 
-                else:
-                    self.log(
-                        f"{Fore.MAGENTA + Style.BRIGHT}[ Quests{Style.RESET_ALL}"
-                        f"{Fore.RED + Style.BRIGHT} Data Is None {Style.RESET_ALL}"
-                        f"{Fore.MAGENTA + Style.BRIGHT}]{Style.RESET_ALL}"
-                    )
+        self.state.replace(telegram_id, 'leagues', leagues)
+        return True
+
+    async def run_referral(self, account: SnapsterAccount):
+        claim_refferal = await self.claim_refferal(account)
+        if claim_refferal and claim_refferal.message is Message.REFERRAL_CLAIMED:
+            rewards = claim_refferal.points
+            if rewards > 0:
+                self.credit(account.telegram_id, rewards)
+                self.log('INFO', 'referral.claimed', telegram_id=account.telegram_id, points=rewards)
+            else:
+                self.log('INFO', 'referral.empty', telegram_id=account.telegram_id)
+            return True
+
+        self.log('WARNING', 'referral.failed', telegram_id=account.telegram_id)
+        return False
+
+    async def run_mining(self, account: SnapsterAccount):
+        claim_mining = await self.claim_mining(account)
+        if claim_mining and claim_mining.message is Message.MINING_CLAIMED:
+            rewards = claim_mining.points
+            if rewards > 0:
+                self.credit(account.telegram_id, rewards)
+                self.log('INFO', 'mining.claimed', telegram_id=account.telegram_id, points=rewards)
+            else:
+                self.log('INFO', 'mining.empty', telegram_id=account.telegram_id)
+            return True
+
+        self.log('WARNING', 'mining.failed', telegram_id=account.telegram_id)
+        return False
+
+    async def run_quests(self, account: SnapsterAccount):
+        quests = await self.fetch_quests(account)
+        if quests is None:
+            self.log('WARNING', 'quests.missing', telegram_id=account.telegram_id)
+            return False
+
+        await self.process_quests(account, quests)
+        self.state.replace(account.telegram_id, 'quests', quests)
+        return True
+
+    async def run_step(self, step: Step, account: SnapsterAccount, needs: dict, next_due: dict, after: list):
+        """Run one registered step once the steps it comes after have finished, then journal its next due time."""
+        if after:
+            await asyncio.wait(after)
+
+        telegram_id = account.telegram_id
+        inputs = {need: needs[need] for need in step.needs}
+        due_at = getattr(self, step.due)(**inputs) if step.due else None
+        if due_at is not None:
+            next_due[step.name] = due_at
+            self.log('INFO', 'step.not_due', telegram_id=telegram_id, step=step.name, due_at=due_at)
+        else:
+            try:
+                ok = await getattr(self, step.run)(account, **inputs)
+            except Exception as e:
+                next_due[step.name] = time.time() + STEP_RETRY_DELAY
+                self.log('ERROR', 'step.error', telegram_id=telegram_id, step=step.name, error=str(e))
+                return
+
+            if not ok:
+                next_due[step.name] = time.time() + STEP_RETRY_DELAY
+        self.journal.record(telegram_id, step.name, next_due[step.name])
+
+    def plan_daily(self, cache: dict):
+        user = cache['user']
+        if user is not None and self.daily_due(user) is not None:
+            return {}, 0
+        return {'claimDailyQuestBonus': 1}, 1
+
+    def plan_leagues(self, cache: dict):
+        calls = {}
+        leagues = cache['leagues']
+        if leagues is None or cache['expired']['leagues'] or not self.catalog.knows('leagues', leagues):
+            calls['getLeagues'] = 1
+        if leagues is None:
+            calls['claimLeagueBonus'] = 1
+        else:
+            user = cache['user']
+            calls['claimLeagueBonus'] = sum(
+                1 for league_id, entry in leagues.items()
+                if league_id in self.catalog.leagues and not self.journal.done(cache['telegram_id'], f'league:{league_id}')
+                and (entry['status'] in ('CURRENT', 'UNCLAIMED') or (
+                    entry['status'] == 'NOT_ELIGIBLE' and entry.get('eligibleAt') is not None
+                    and user is not None and user.points >= entry['eligibleAt']
+                ))
+            )
+        return calls, sum(calls.values())
+
+    def plan_referral(self, cache: dict):
+        return {'claimReferralPoints': 1}, 1
+
+    def plan_mining(self, cache: dict):
+        return {'claimMiningBonus': 1}, 1
+
+    def plan_quests(self, cache: dict):
+        quests = cache['quests']
+        fetch = int(quests is None or cache['expired']['quests'] or not self.catalog.knows('quests', quests))
+        if quests is None:
+            return {'getQuests': 1}, 1
+
+        statuses = Counter(quests.values())
+        earn, claims = statuses['EARN'], statuses['EARN'] + statuses['UNCLAIMED']
+        calls = {'getQuests': fetch, 'startQuest': earn, 'claimQuestBonus': claims}
+        return calls, fetch + math.ceil(earn / QUEST_CONCURRENCY) + math.ceil(claims / QUEST_CONCURRENCY)
+
+    async def process_query(self, query: str, steps=STEPS):
+        """Run the due `steps` of one account through STEP_REGISTRY and return (next due times, processed).
+
+        Inputs the steps need are fetched once up front; steps without an `after` dependency on each other run
+        concurrently, so referral, mining and quests no longer wait on daily and leagues. `processed` is False
+        for an account skipped without any request because its init data expired.
+        """
+        now = time.time()
+        next_due = {step: now + STEP_REGISTRY[step].interval for step in steps}
+
+        telegram_id = str(self.load_data(query))
+        if not telegram_id:
+            self.log('WARNING', 'account.login_failed', telegram_id=telegram_id)
+            return next_due, True
+
+        init_data = self.accounts.parse(query)
+        if init_data.is_stale(self.init_data_ttl, now):
+            self.stale[telegram_id] = init_data.auth_date
+            return next_due, False
+
+        resumed = self.journal.completed(telegram_id, steps)
+        if resumed:
+            next_due.update(resumed)
+            steps = tuple(step for step in steps if step not in resumed)
+            self.log('INFO', 'account.resumed', telegram_id=telegram_id, steps=', '.join(resumed))
+            if not steps:
+                return next_due, True
+
+        blocked = self.blocked_steps(steps)
+        if blocked:
+            for step, (endpoint, retry_at) in blocked.items():
+                next_due[step] = retry_at
+                self.log('INFO', 'step.skipped', telegram_id=telegram_id, step=step, endpoint=endpoint, retry_at=retry_at)
+            steps = tuple(step for step in steps if step not in blocked)
+            if not steps:
+                return next_due, True
+
+        account = SnapsterAccount(telegram_id, query)
+        needs = {}
+        for need in dict.fromkeys(need for step in steps for need in STEP_REGISTRY[step].needs):
+            needs[need] = await getattr(self, f'fetch_{need}')(account)
+
+        if 'user' in needs:
+            user = needs['user']
+            if user is None:
+                self.log('WARNING', 'account.user_missing', telegram_id=telegram_id)
             else:
                 self.log(
-                    f"{Fore.MAGENTA + Style.BRIGHT}[ Account ID{Style.RESET_ALL}"
-                    f"{Fore.WHITE + Style.BRIGHT} {telegram_id} {Style.RESET_ALL}"
-                    f"{Fore.MAGENTA + Style.BRIGHT}] [ Status{Style.RESET_ALL}"
-                    f"{Fore.RED + Style.BRIGHT} User Data Is None {Style.RESET_ALL}"
-                    f"{Fore.MAGENTA + Style.BRIGHT}]{Style.RESET_ALL}"
+                    'INFO', 'account.user', telegram_id=telegram_id, username=user.username,
+                    points=user.points, league=user.league
                 )
+        else:
+            self.log('INFO', 'account.id', telegram_id=telegram_id)
+
+        missing = [step for step in steps if any(needs[need] is None for need in STEP_REGISTRY[step].needs)]
+        for step in missing:
+            next_due[step] = now + STEP_RETRY_DELAY
+
+        tasks = {}
+        for step in steps:
+            if step in missing:
+                continue
+            spec = STEP_REGISTRY[step]
+            after = [tasks[dependency] for dependency in spec.after if dependency in tasks]
+            tasks[step] = asyncio.ensure_future(self.run_step(spec, account, needs, next_due, after))
+        if tasks:
+            await asyncio.gather(*tasks.values())
 
-    def main(self):
+        return next_due, True
+
+    def create_session(self):
+        """Shared client for every account; with --http2 all accounts multiplex over one connection.
+
+        HTTP/2 is negotiated through ALPN, so a server (or proxy) that only speaks HTTP/1.1 is served from the
+        same pool as before, and the repeated BASE_HEADERS are HPACK-compressed down to table indexes.
+        """
+        http2 = self.http2 and h2_available
+        if self.http2 and not http2:
+            self.log('WARNING', 'http2.unavailable')
+
+        limits = httpx.Limits(
+            max_connections=self.concurrency,
+            max_keepalive_connections=self.concurrency,
+            keepalive_expiry=60
+        )
+        transport = None
+        if self.replay_path:
+            transport = CassetteTransport(self.replay_path, self.replay_scale)
+        elif self.record_path:
+            transport = CassetteRecorder(self.record_path, httpx.AsyncHTTPTransport(http2=http2, limits=limits))
+        return httpx.AsyncClient(
+            base_url=self.base_url, headers=BASE_HEADERS, limits=limits, timeout=REQUEST_TIMEOUT, http2=http2,
+            transport=transport
+        )
+
+    def saved_schedule(self, query: str):
         try:
-            with open('query.txt', 'r') as file:
-                queries = [line.strip() for line in file if line.strip()]
+            return self.state.get(str(self.load_data(query)), 'schedule') or {}
+        except (ValueError, KeyError):
+            return {}
 
-            while True:
-                self.clear_terminal()
-                self.welcome()
+    async def process_account(self, semaphore: asyncio.Semaphore, query: str, steps: tuple):
+        self.queued += 1
+        async with semaphore:
+            self.queued -= 1
+            self.in_flight += 1
+            try:
+                telegram_id = self.accounts.label(query)
+                # An account whose line was replaced mid-run must not be claimed twice at once.
+                next_due, processed = await self.single_flight(
+                    ('process_query', telegram_id), lambda: self.process_query(query, steps)
+                )
+                if processed:
+                    self.processed += 1
+                    self.metrics.account(True)
+            except asyncio.CancelledError:
+                # Shutting down: keep the saved schedule so the next start resumes instead of waiting out a retry.
+                raise
+            except Exception as e:
+                self.log('ERROR', 'account.error', telegram_id=telegram_id, error=str(e))
+                next_due = {step: time.time() + STEP_RETRY_DELAY for step in steps}
+                self.failed += 1
+                self.metrics.account(False)
+            finally:
+                self.in_flight -= 1
+
+        self.scheduler.schedule(query, next_due)
+        try:
+            self.state.put(str(self.load_data(query)), 'schedule', self.scheduler.due[query])
+        except (ValueError, KeyError):
+            pass
+
+    async def countdown(self, seconds: int, limit: int = None):
+        limit = seconds if limit is None else min(seconds, limit)
+        first = not self.idle
+        self.idle = True
+        if first:
+            self.summarize()
+
+        if self.events is not None and first:
+            self.events.put(('idle', self.worker, {
+                'processed': self.processed,
+                'failed': self.failed,
+                'next_wakeup': time.time() + seconds
+            }))
+        if self.events is not None or self.dashboard:
+            await asyncio.sleep(limit)
+            return
+
+        if first:
+            self.log('INFO', 'separator')
+        while limit > 0:
+            formatted_time = self.format_seconds(seconds)
+            print(
+                f"{Fore.CYAN+Style.BRIGHT}[ Wait for{Style.RESET_ALL}"
+                f"{Fore.WHITE+Style.BRIGHT} {formatted_time} {Style.RESET_ALL}"
+                f"{Fore.CYAN+Style.BRIGHT}... ]{Style.RESET_ALL}",
+                end="\r"
+            )
+            await asyncio.sleep(1)
+            seconds -= 1
+            limit -= 1
+
+    def plan(self, now: float = None):
+        """Work out offline, from state.db alone, what the next pass would do for every account in query.txt.
+
+        Each account's due steps come from its saved schedule and each step's calls from `plan_<step>` over the
+        cached user, league and quest data (used even when past its TTL, with the refetch counted). The wall-clock
+        estimate is the larger of the rate-limit bound and the round trips spread over `concurrency` at
+        PLAN_REQUEST_LATENCY each.
+        """
+        started = time.perf_counter()
+        now = time.time() if now is None else now
+        self.accounts.reload(force=True)
+        self.journal = ClaimJournal(self.journal_path, readonly=True)
+        saved = {kind: self.state.load(kind) for kind in ('schedule', 'user', 'leagues', 'quests')}
+
+        calls = Counter()
+        step_counts = Counter()
+        due_accounts = stale = uncached = round_trips = longest = 0
+        for query in self.accounts.queries:
+            try:
+                init_data = self.accounts.parse(query)
+            except (ValueError, KeyError):
+                continue
+
+            telegram_id = init_data.telegram_id
+            if init_data.is_stale(self.init_data_ttl, now):
+                stale += 1
+                continue
+
+            schedule = json_loads(saved['schedule'][telegram_id][0]) if telegram_id in saved['schedule'] else {}
+            steps = [
+                step for step in STEPS
+                if schedule.get(step, 0.0) <= now + WAKE_SLACK and not self.journal.done(telegram_id, step)
+            ]
+            if not steps:
+                continue
+
+            cache = {'telegram_id': telegram_id, 'expired': {}}
+            for kind in ('user', 'leagues', 'quests'):
+                payload, updated_at = saved[kind].get(telegram_id, (None, 0.0))
+                cache[kind] = json_loads(payload) if payload is not None else None
+                cache['expired'][kind] = now - updated_at > STATE_TTL[kind]
+            if cache['user'] is not None:
+                cache['user'] = User.from_data(cache['user']) if 'pointsCount' in cache['user'] else None
+            if cache['user'] is None:
+                uncached += 1
+
+            fetch_user = int(
+                any(STEP_REGISTRY[step].needs for step in steps) and (cache['user'] is None or cache['expired']['user'])
+            )
+            finished = {}
+            requests = fetch_user
+            for step in steps:
+                step_calls, step_round_trips = getattr(self, f'plan_{step}')(cache)
+                if not step_round_trips:
+                    continue
+                finished[step] = max((finished.get(after, 0) for after in STEP_REGISTRY[step].after), default=0) + step_round_trips
+                step_counts[step] += 1
+                for endpoint, count in step_calls.items():
+                    calls[endpoint] += count
+                    requests += count
+
+            if not requests:
+                continue
+
+            due_accounts += 1
+            calls['getUserByTelegramId'] += fetch_user
+            account_round_trips = fetch_user + max(finished.values(), default=0)
+            round_trips += account_round_trips
+            longest = max(longest, account_round_trips)
+            self.log('DEBUG', 'plan.account', telegram_id=telegram_id, steps=', '.join(finished), requests=requests)
+
+        calls = +calls
+        requests = sum(calls.values())
+        rate_bound = max(
+            [requests / self.rate] + [
+                count / self.endpoint_rates[endpoint] for endpoint, count in calls.items() if endpoint in self.endpoint_rates
+            ]
+        )
+        latency_bound = max(round_trips / self.concurrency, longest) * PLAN_REQUEST_LATENCY
+        return {
+            'accounts': len(self.accounts.queries),
+            'due': due_accounts,
+            'stale': stale,
+            'uncached': uncached,
+            'steps': step_counts,
+            'calls': calls,
+            'requests': requests,
+            'estimate': max(rate_bound, latency_bound),
+            'elapsed': time.perf_counter() - started
+        }
+
+    def report_plan(self, plan: dict):
+        self.log(
+            'INFO', 'plan.summary', accounts=plan['accounts'], due=plan['due'], stale=plan['stale'],
+            uncached=plan['uncached'], requests=plan['requests'], estimate_seconds=round(plan['estimate']),
+            elapsed_ms=round(plan['elapsed'] * 1000)
+        )
+        for step in STEPS:
+            self.log('INFO', 'plan.step', step=step, accounts=plan['steps'][step])
+        for endpoint, calls in sorted(plan['calls'].items()):
+            self.log('INFO', 'plan.endpoint', endpoint=endpoint, calls=calls)
+
+    def summarize(self):
+        """Close the metrics cycle and log its totals, per-endpoint latency and the accounts skipped as stale."""
+        if self.stale:
+            telegram_ids = sorted(self.stale, key=self.stale.get)
+            shown = ', '.join(telegram_ids[:STALE_REPORT_LIMIT])
+            if len(telegram_ids) > STALE_REPORT_LIMIT:
+                shown += f' (+{len(telegram_ids) - STALE_REPORT_LIMIT} more)'
+            self.log('WARNING', 'accounts.stale', count=len(telegram_ids), telegram_ids=shown)
+            self.stale.clear()
+
+        cycle = self.metrics.end_cycle()
+        if not cycle['processed'] and not cycle['failed']:
+            return
+
+        if self.profiler is not None:
+            profile = self.profiler.cycle()
+            self.log(
+                'INFO', 'profile.cycle', path=profile['path'],
+                cpu_ms=round(profile['cpu'] * 1000), peak_kb=round(profile['peak'] / 1024)
+            )
+            for stat in profile['growth']:
+                frame = stat.traceback[0]
                 self.log(
-                    f"{Fore.GREEN + Style.BRIGHT}Account's Total: {Style.RESET_ALL}"
-                    f"{Fore.WHITE + Style.BRIGHT}{len(queries)}{Style.RESET_ALL}"
+                    'INFO', 'profile.allocation', location=f'{frame.filename}:{frame.lineno}',
+                    size_kb=round(stat.size_diff / 1024, 1), blocks=stat.count_diff
+                )
+
+        self.log(
+            'INFO', 'cycle.summary', elapsed_seconds=time.time() - cycle['started'],
+            processed=cycle['processed'], failed=cycle['failed'], points=cycle['points']
+        )
+        for endpoint, histogram in sorted(cycle['latency'].items()):
+            p99 = histogram.quantile(0.99)
+            p99 = f"<= {p99 * 1000:.0f} ms" if p99 != math.inf else f"> {LATENCY_BUCKETS[-1] * 1000:.0f} ms"
+            self.log(
+                'INFO', 'cycle.endpoint', endpoint=endpoint, calls=histogram.count,
+                avg_ms=round(histogram.sum / histogram.count * 1000), p99=p99, retries=cycle['retries'][endpoint]
+            )
+
+    async def serve_metrics(self):
+        """Serve the OpenMetrics exposition on http://127.0.0.1:<metrics_port>/metrics."""
+        async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            try:
+                request_line = await reader.readline()
+                while await reader.readline() not in (b'\r\n', b'\n', b''):
+                    pass
+
+                target = request_line.split()[1:2]
+                if target and target[0].split(b'?', 1)[0] == b'/metrics':
+                    status, content_type = '200 OK', 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+                    body = self.metrics.render().encode()
+                else:
+                    status, content_type, body = '404 Not Found', 'text/plain; charset=utf-8', b'Not Found\n'
+
+                writer.write(
+                    f'HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n'
+                    f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body
                 )
-                self.log(f"{Fore.CYAN + Style.BRIGHT}-{Style.RESET_ALL}"*75)
-
-                for query in queries:
-                    query = query.strip()
-                    if query:
-                        self.process_query(query)
-                        self.log(f"{Fore.CYAN + Style.BRIGHT}-{Style.RESET_ALL}"*75)
-                        seconds = 60
-                        while seconds > 0:
-                            formatted_time = self.format_seconds(seconds)
-                            print(
-                                f"{Fore.CYAN+Style.BRIGHT}[ Wait for{Style.RESET_ALL}"
-                                f"{Fore.WHITE+Style.BRIGHT} {formatted_time} {Style.RESET_ALL}"
-                                f"{Fore.CYAN+Style.BRIGHT}... ]{Style.RESET_ALL}",
-                                end="\r"
-                            )
-                            time.sleep(1)
-                            seconds -= 1
-
-                seconds = 1800
-                while seconds > 0:
-                    formatted_time = self.format_seconds(seconds)
-                    print(
-                        f"{Fore.CYAN+Style.BRIGHT}[ Wait for{Style.RESET_ALL}"
-                        f"{Fore.WHITE+Style.BRIGHT} {formatted_time} {Style.RESET_ALL}"
-                        f"{Fore.CYAN+Style.BRIGHT}... ]{Style.RESET_ALL}",
-                        end="\r"
+                await writer.drain()
+            except ConnectionError:
+                pass
+            finally:
+                writer.close()
+
+        return await asyncio.start_server(handle, '127.0.0.1', self.metrics_port)
+
+    def snapshot(self):
+        cycle = self.metrics.last_cycle if self.idle and self.metrics.last_cycle else self.metrics.cycle
+        return {
+            'accounts': len(self.accounts.queries),
+            'in_flight': self.in_flight,
+            'queued': self.queued,
+            'done': cycle['processed'],
+            'failed': cycle['failed'],
+            'points': cycle['points'],
+            'requests': self.metrics.requests,
+            'next_wakeup': self.scheduler.next_wakeup()
+        }
+
+    async def refresh_dashboard(self):
+        """Draw the dashboard at DASHBOARD_HZ; a worker publishes its snapshot to the parent instead."""
+        view = Dashboard() if self.events is None else None
+        try:
+            while True:
+                if view is None:
+                    self.events.put(('stats', self.worker, self.snapshot()))
+                else:
+                    view.draw(self.snapshot())
+                await asyncio.sleep(1 / DASHBOARD_HZ)
+        finally:
+            if view is not None:
+                view.close()
+
+    async def run(self):
+        server = None
+        dashboard = None
+        self.journal = ClaimJournal(self.journal_path)
+        # Started here rather than in __init__, so the workers parent and --plan never profile themselves.
+        if self.profile_dir:
+            self.profiler = CycleProfiler(self.profile_dir, self.worker)
+        try:
+            if self.metrics_port:
+                server = await self.serve_metrics()
+            if self.dashboard:
+                dashboard = asyncio.create_task(self.refresh_dashboard())
+            async with self.create_session() as self.session:
+                await self.run_forever()
+        finally:
+            if dashboard is not None:
+                dashboard.cancel()
+            if server is not None:
+                server.close()
+            self.journal.close()
+            self.state.close()
+
+    def banner(self, total: int, workers: int = 1):
+        if not self.dashboard:
+            self.clear_terminal()
+            self.welcome()
+        self.log('INFO', 'banner', total=total, concurrency=self.concurrency, workers=workers)
+        self.log('INFO', 'separator')
+
+    def reload_accounts(self, force: bool = False):
+        added, removed = self.accounts.reload(force)
+        for query in removed:
+            self.scheduler.remove(query)
+        for query in added:
+            self.scheduler.add(query, self.saved_schedule(query))
+        if (added or removed) and self.accounts.duplicates:
+            self.log('WARNING', 'accounts.duplicates', duplicates=self.accounts.duplicates)
+        if self.accounts.invalid != self.invalid:
+            self.invalid = self.accounts.invalid
+            if self.invalid:
+                self.log('WARNING', 'accounts.invalid', invalid=self.invalid)
+        return added, removed
+
+    async def run_pass(self):
+        """Process every account that is due right now once, then return."""
+        self.reload_accounts(force=True)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        await asyncio.gather(*(
+            self.process_account(semaphore, query, steps) for query, steps in self.scheduler.pop_due(time.time())
+        ))
+        self.summarize()
+
+    async def run_forever(self):
+        self.reload_accounts(force=True)
+        if self.events is None:
+            self.banner(len(self.accounts.queries))
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        try:
+            while True:
+                added, removed = self.reload_accounts()
+                if added or removed:
+                    self.log('INFO', 'accounts.reloaded', added=len(added), removed=len(removed), total=len(self.accounts.queries))
+
+                for query, steps in self.scheduler.pop_due(time.time()):
+                    if self.idle and self.events is not None:
+                        self.events.put(('busy', self.worker, None))
+                    self.idle = False
+                    tasks.add(asyncio.create_task(self.process_account(semaphore, query, steps)))
+
+                next_wakeup = self.scheduler.next_wakeup()
+                timeout = ACCOUNT_RELOAD_INTERVAL
+                if next_wakeup is not None:
+                    timeout = max(next_wakeup - time.time(), 0)
+
+                if tasks:
+                    _, tasks = await asyncio.wait(
+                        tasks, timeout=min(timeout, ACCOUNT_RELOAD_INTERVAL), return_when=asyncio.FIRST_COMPLETED
+                    )
+                else:
+                    await self.countdown(math.ceil(timeout), ACCOUNT_RELOAD_INTERVAL)
+        finally:
+            # Stop accounts still mid-request before run() closes the session, journal and state under them;
+            # shielded single-flight calls are not cancelled with their callers, so cancel those too.
+            pending = [*tasks, *self.flights.values()]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def run_sharded(self, workers: int):
+        options = {
+            'concurrency': self.concurrency,
+            'base_url': self.base_url,
+            'state_path': self.state_path,
+            'journal_path': self.journal_path,
+            'query_path': self.accounts.path,
+            'metrics_port': self.metrics_port,
+            'dashboard': self.dashboard,
+            'init_data_ttl': self.init_data_ttl,
+            'http2': self.http2,
+            'record_path': self.record_path,
+            'replay_path': self.replay_path,
+            'replay_scale': self.replay_scale,
+            'profile_dir': self.profile_dir,
+            'rate': self.rate / workers,
+            'endpoint_rates': {endpoint: rate / workers for endpoint, rate in self.endpoint_rates.items()}
+        }
+        import multiprocessing
+
+        context = multiprocessing.get_context('spawn')
+        events = context.Queue()
+        processes = [
+            context.Process(target=run_worker, args=(worker, workers, options, events), daemon=True)
+            for worker in range(workers)
+        ]
+
+        self.banner(sum(1 for _ in self.accounts.stream()), workers)
+        for process in processes:
+            process.start()
+
+        idle = {}
+        stats = {}
+        view = Dashboard(workers) if self.dashboard else None
+        drawn_at = 0
+        try:
+            while any(process.is_alive() for process in processes):
+                if view is not None and stats and time.monotonic() - drawn_at >= 1 / DASHBOARD_HZ:
+                    view.draw(Dashboard.combine(stats.values()))
+                    drawn_at = time.monotonic()
+
+                try:
+                    kind, worker, payload = events.get(timeout=1 / DASHBOARD_HZ)
+                except queue.Empty:
+                    continue
+
+                if kind == 'stats':
+                    stats[worker] = payload
+                elif kind == 'log':
+                    self.logger.submit(LogEvent(*payload, worker))
+                elif kind == 'busy':
+                    idle.pop(worker, None)
+                elif kind == 'idle':
+                    idle[worker] = payload
+                    next_wakeup = min(stats['next_wakeup'] for stats in idle.values())
+                    self.log(
+                        'INFO', 'workers.idle', idle=len(idle), workers=len(processes),
+                        processed=sum(stats['processed'] for stats in idle.values()),
+                        failed=sum(stats['failed'] for stats in idle.values()), next_wakeup_at=next_wakeup
                     )
-                    time.sleep(1)
-                    seconds -= 1
+        finally:
+            if view is not None:
+                view.close()
+            for process in processes:
+                process.terminate()
+            self.state.close()
+
+    def main(self, workers: int = 1, plan: bool = False):
+        just_fix_windows_console()
+        try:
+            if plan:
+                self.report_plan(self.plan())
+            elif workers > 1:
+                self.run_sharded(workers)
+            else:
+                asyncio.run(self.run())
 
         except KeyboardInterrupt:
-            self.log(f"{Fore.RED + Style.BRIGHT}[ EXIT ] Snapster Trading App - BOT.{Style.RESET_ALL}")
+            self.log('INFO', 'exit')
         except Exception as e:
-            self.log(f"{Fore.RED + Style.BRIGHT}An error occurred: {e}{Style.RESET_ALL}")
+            self.log('ERROR', 'error', error=str(e))
+        finally:
+            self.logger.close()
+
+def shard_for(telegram_id: str, workers: int):
+    """Rendezvous-hash an account onto a worker: stable across restarts, and only ~1/N accounts move when N changes."""
+    return max(
+        range(workers),
+        key=lambda worker: hashlib.blake2b(f'{worker}:{telegram_id}'.encode(), digest_size=8).digest()
+    )
+
+def run_worker(worker: int, workers: int, options: dict, events):
+    if options.get('journal_path'):
+        options = {**options, 'journal_path': f"{options['journal_path']}.{worker}"}
+    if options.get('metrics_port'):
+        options = {**options, 'metrics_port': options['metrics_port'] + worker}
+    if options.get('record_path'):
+        options = {**options, 'record_path': f"{options['record_path']}.{worker}"}
+    snapster = SnapsterTradingApp(worker=worker, events=events, shard=(worker, workers), **options)
+    try:
+        asyncio.run(snapster.run())
+    except KeyboardInterrupt:
+        pass
+
+def parse_args():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Snapster Trading App - BOT")
+    parser.add_argument('--concurrency', type=int, default=10, help="number of accounts processed at the same time")
+    parser.add_argument('--base-url', default=BASE_URL, help="API base url, e.g. a local mock_server.py")
+    parser.add_argument('--state', default='state.db', help="path of the persistent account state cache")
+    parser.add_argument('--journal', default='journal.log', help="write-ahead claim journal used to resume interrupted cycles")
+    parser.add_argument('--workers', type=int, default=1, help="number of processes; accounts are sharded by telegram id")
+    parser.add_argument('--rate', type=float, default=RATE_LIMIT, help="global request budget in requests per second")
+    parser.add_argument(
+        '--init-data-ttl', type=float, default=INIT_DATA_TTL / 3600,
+        help="hours after auth_date an account's init data is treated as expired and skipped (0 disables)"
+    )
+    parser.add_argument(
+        '--metrics-port', type=int, default=None,
+        help="serve OpenMetrics on 127.0.0.1:PORT/metrics; worker i of --workers uses PORT+i"
+    )
+    parser.add_argument('--http2', action='store_true', help="multiplex requests over HTTP/2 (needs httpx[http2])")
+    parser.add_argument('--record', default=None, metavar='PATH', help="append anonymized request/response pairs to a gzipped cassette")
+    parser.add_argument('--replay', default=None, metavar='PATH', help="answer every request from a recorded cassette, without network")
+    parser.add_argument('--replay-scale', type=float, default=1.0, help="multiplier for recorded latencies on --replay (0 = no delay)")
+    parser.add_argument('--profile', default=None, metavar='DIR', help="write a cProfile and tracemalloc snapshot per cycle to DIR")
+    parser.add_argument('--log-file', default='bot.log', help="rotating JSON-lines log file ('' to disable)")
+    parser.add_argument('--log-level', default='INFO', choices=LOG_LEVELS, help="minimum level shown on the console")
+    parser.add_argument('--log-sample', type=float, default=1.0, help="fraction of per-account INFO lines shown on the console")
+    parser.add_argument('--quiet', action='store_true', help="disable the console log sink")
+    parser.add_argument('--plan', action='store_true', help="print what the next pass would do from state.db, without any request")
+    parser.add_argument('--dashboard', action='store_true', help="show a live aggregate view instead of per-account log lines")
+    parser.add_argument(
+        '--endpoint-rate', action='append', default=[], metavar='ENDPOINT=RATE',
+        help="per-endpoint budget, e.g. claimQuestBonus=5 (repeatable)"
+    )
+    return parser.parse_args()
+
+def parse_endpoint_rates(values: list):
+    endpoint_rates = {}
+    for value in values:
+        endpoint, _, rate = value.partition('=')
+        endpoint_rates[endpoint] = float(rate)
+    return endpoint_rates
 
 if __name__ == "__main__":
-    snapster = SnapsterTradingApp()
-    snapster.main()
+    args = parse_args()
+    snapster = SnapsterTradingApp(
+        concurrency=args.concurrency, base_url=args.base_url, state_path=args.state,
+        journal_path=args.journal,
+        rate=args.rate, endpoint_rates=parse_endpoint_rates(args.endpoint_rate), metrics_port=args.metrics_port,
+        logger=LogPipeline(args.log_file, not (args.quiet or args.dashboard), args.log_level, args.log_sample),
+        dashboard=args.dashboard, init_data_ttl=args.init_data_ttl * 3600,
+        http2=args.http2, record_path=args.record, replay_path=args.replay, replay_scale=args.replay_scale,
+        profile_dir=args.profile
+    )
+    snapster.main(workers=args.workers, plan=args.plan)
@@ -0,0 +1,233 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+import urllib.parse
+from datetime import datetime, timedelta, timezone
+
+LEAGUES = [
+    (1, 'Bronze', 0),
+    (2, 'Silver', 1000),
+    (3, 'Gold', 5000),
+    (4, 'Platinum', 20000),
+    (5, 'Diamond', 100000)
+]
+STATUS_TEXT = {200: 'OK', 404: 'Not Found', 429: 'Too Many Requests', 500: 'Internal Server Error'}
+
+def make_query(telegram_id: int, auth_date: int = None):
+    """Build a synthetic Telegram init-data line in the same shape as query.txt."""
+    user = json.dumps({'id': telegram_id, 'first_name': f'user{telegram_id}', 'username': f'user{telegram_id}'})
+    return urllib.parse.urlencode({
+        'query_id': f'AA{telegram_id:012d}',
+        'user': user,
+        'auth_date': auth_date or int(time.time()),
+        'hash': f'{random.getrandbits(256):064x}'
+    })
+
+def iso(moment: datetime):
+    return moment.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+class MockSnapster:
+    """In-memory stand-in for prod.snapster.bot with latency, error and 429 injection."""
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.02, error_rate: float = 0.0,
+                 throttle_rate: float = 0.0, quests: int = 10) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.quests = quests
+        self.users = {}
+        self.routes = {
+            '/api/user/getUserByTelegramId': self.get_user,
+            '/api/dailyQuest/claimDailyQuestBonus': self.claim_daily,
+            '/api/user/getLeagues': self.get_leagues,
+            '/api/user/claimLeagueBonus': self.claim_league,
+            '/api/referral/claimReferralPoints': self.claim_referral,
+            '/api/user/claimMiningBonus': self.claim_mining,
+            '/api/quest/getQuests': self.get_quests,
+            '/api/quest/startQuest': self.start_quest,
+            '/api/quest/claimQuestBonus': self.claim_quest
+        }
+
+    def user(self, telegram_id):
+        telegram_id = int(telegram_id)
+        if telegram_id not in self.users:
+            seeded = random.Random(telegram_id)
+            self.users[telegram_id] = {
+                'points': seeded.randint(0, 30000),
+                'last_daily': None,
+                'last_mining': time.time() - seeded.randint(0, 3600),
+                'claimed_leagues': set(),
+                'quests': {quest_id: seeded.choice(['EARN', 'UNCLAIMED', 'CLAIMED']) for quest_id in range(1, self.quests + 1)}
+            }
+        return self.users[telegram_id]
+
+    def league_index(self, points: int):
+        return max(index for index, (_, _, required) in enumerate(LEAGUES) if points >= required)
+
+    def get_user(self, params: dict):
+        user = self.user(params['telegramId'])
+        return 'Successfully fetched User', {
+            'username': f"user{params['telegramId']}",
+            'pointsCount': user['points'],
+            'currentLeague': {'title': LEAGUES[self.league_index(user['points'])][1]},
+            'lastDailyBonusClaimDate': iso(user['last_daily']) if user['last_daily'] else None
+        }
+
+    def claim_daily(self, params: dict):
+        user = self.user(params['telegramId'])
+        now = datetime.now(timezone.utc)
+        if user['last_daily'] and now - user['last_daily'] < timedelta(hours=24):
+            return 'Daily bonus already claimed', None
+
+        user['last_daily'] = now
+        user['points'] += 100
+        return 'Successfully claimed Daily Bonus points', {'pointsClaimed': 100}
+
+    def get_leagues(self, params: dict):
+        user = self.user(params['telegramId'])
+        current = self.league_index(user['points'])
+        leagues = []
+        for index, (league_id, title, required) in enumerate(LEAGUES):
+            if league_id in user['claimed_leagues']:
+                status = 'CLAIMED'
+            elif index < current:
+                status = 'UNCLAIMED'
+            elif index == current:
+                status = 'CURRENT'
+            else:
+                status = 'LOCKED'
+            leagues.append({'leagueId': league_id, 'title': title, 'requiredNumberOfPointsToAchieve': required, 'status': status})
+        return 'Successfully fetched Leagues', leagues
+
+    def claim_league(self, params: dict):
+        user = self.user(params['telegramId'])
+        league_id = int(params['leagueId'])
+        index = next(index for index, league in enumerate(LEAGUES) if league[0] == league_id)
+        if league_id in user['claimed_leagues'] or index >= self.league_index(user['points']):
+            return 'Not eligible for claiming bonus', None
+
+        user['claimed_leagues'].add(league_id)
+        user['points'] += 500
+        # The live API answers league claims with the referral message; the bot matches on it.
+        return 'Successfully claimed Referral points', {'pointsClaimed': 500}
+
+    def claim_referral(self, params: dict):
+        points = random.choice([0, 0, 0, 10, 25])
+        self.user(params['telegramId'])['points'] += points
+        return 'Successfully claimed Referral points', {'pointsClaimed': points}
+
+    def claim_mining(self, params: dict):
+        user = self.user(params['telegramId'])
+        now = time.time()
+        points = int((now - user['last_mining']) / 60)
+        user['last_mining'] = now
+        user['points'] += points
+        return 'Successfully claimed Mining Bonus points', {'pointsClaimed': points}
+
+    def get_quests(self, params: dict):
+        user = self.user(params['telegramId'])
+        return 'Successfully fetched Quests for User', [
+            {'id': quest_id, 'title': f'Quest {quest_id}', 'status': status}
+            for quest_id, status in user['quests'].items()
+        ]
+
+    def start_quest(self, params: dict):
+        quests = self.user(params['telegramId'])['quests']
+        quest_id = int(params['questId'])
+        if quests.get(quest_id) != 'EARN':
+            return 'Quest already started', None
+
+        quests[quest_id] = 'UNCLAIMED'
+        return 'Successfully started Quest earn', None
+
+    def claim_quest(self, params: dict):
+        user = self.user(params['telegramId'])
+        quest_id = int(params['questId'])
+        if user['quests'].get(quest_id) != 'UNCLAIMED':
+            return 'Not possible to claim bonus for this quest', None
+
+        user['quests'][quest_id] = 'CLAIMED'
+        user['points'] += 50
+        return 'Successfully claimed Quest points', {'pointsClaimed': 50}
+
+    async def handle(self, method: str, target: str, body: bytes):
+        await asyncio.sleep(max(random.gauss(self.latency, self.jitter), 0))
+
+        url = urllib.parse.urlsplit(target)
+        route = self.routes.get(url.path)
+        if route is None:
+            return 404, {'message': 'Not Found'}, {}
+
+        roll = random.random()
+        if roll < self.throttle_rate:
+            return 429, {'message': 'Too Many Requests'}, {'Retry-After': '1'}
+        if roll < self.throttle_rate + self.error_rate:
+            return 500, {'message': 'Internal Server Error'}, {}
+
+        params = {key: values[0] for key, values in urllib.parse.parse_qs(url.query).items()}
+        if body:
+            params.update(json.loads(body))
+        message, data = route(params)
+        return 200, {'message': message, 'data': data}, {}
+
+    async def serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                status, payload, extra_headers = await self.handle(method, target, body)
+                content = json.dumps(payload).encode()
+                head = [f'HTTP/1.1 {status} {STATUS_TEXT.get(status, "")}', 'Content-Type: application/json', f'Content-Length: {len(content)}']
+                head += [f'{name}: {value}' for name, value in extra_headers.items()]
+                writer.write(('\r\n'.join(head) + '\r\n\r\n').encode() + content)
+                await writer.drain()
+
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8080):
+        server = await asyncio.start_server(self.serve_client, host, port, backlog=4096)
+        print(f'Mock Snapster API listening on http://{host}:{port}', flush=True)
+        async with server:
+            await server.serve_forever()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Snapster API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=50, help="mean response latency in milliseconds")
+    parser.add_argument('--jitter', type=float, default=20, help="latency standard deviation in milliseconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with HTTP 500")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="fraction of requests answered with HTTP 429")
+    parser.add_argument('--quests', type=int, default=10, help="number of quests per user")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    mock = MockSnapster(
+        latency=args.latency / 1000, jitter=args.jitter / 1000,
+        error_rate=args.error_rate, throttle_rate=args.throttle_rate, quests=args.quests
+    )
+    try:
+        asyncio.run(mock.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,57 @@
+import time
+
+import bot
+
+
+def open_breaker():
+    breaker = bot.CircuitBreaker()
+    for _ in range(bot.BREAKER_FAILURES):
+        breaker.failure(breaker.allow())
+    assert breaker.state == breaker.OPEN
+    return breaker
+
+
+def test_breaker_ignores_late_success_while_open():
+    breaker = bot.CircuitBreaker()
+    late = breaker.allow()
+    for _ in range(bot.BREAKER_FAILURES):
+        breaker.failure(breaker.allow())
+
+    assert not breaker.success(late)
+    assert breaker.state == breaker.OPEN
+    assert breaker.retry_at() is not None
+
+
+def test_breaker_only_closes_on_probe_success():
+    breaker = open_breaker()
+    late = True
+    breaker.opened_at = time.time() - bot.BREAKER_COOLDOWN
+    probe = breaker.allow()
+    assert probe is not None and breaker.state == breaker.HALF_OPEN
+
+    assert not breaker.success(late)
+    assert breaker.state == breaker.HALF_OPEN
+    assert breaker.success(probe)
+    assert breaker.state == breaker.CLOSED
+
+
+def test_reload_skips_unparseable_lines(tmp_path):
+    path = tmp_path / 'query.txt'
+    line = 'query_id=AAA&auth_date=1&hash=secret'
+    path.write_text(f'{line}\n')
+    accounts = bot.AccountSource(str(path))
+
+    assert accounts.reload(force=True) == ([], [])
+    assert accounts.invalid == 1
+    assert 'secret' not in accounts.label(line)
+
+
+def test_simultaneous_overloads_halve_rate_once():
+    bucket = bot.TokenBucket(10)
+    for _ in range(20):
+        bucket.on_overload()
+    assert bucket.rate == 10 * bot.AIMD_DECREASE
+
+    bucket.decreased_at -= bucket.capacity / bucket.rate
+    bucket.on_overload()
+    assert bucket.rate == 10 * bot.AIMD_DECREASE ** 2